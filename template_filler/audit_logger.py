@@ -5,17 +5,250 @@ AuditLogger: 操作日志记录系统
 """
 
 import os
-import json
+import time
+import queue
+import atexit
 import logging
+import threading
+import contextlib
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple
 from datetime import datetime
+import heapq
 import uuid
 
+from . import json_codec
+from .paths import BASE_DIR, ensure_dir
+
+
+def _preview(value: str, limit: int) -> str:
+    """截断过长文本，超出部分以省略号表示"""
+    return value if len(value) <= limit else f'{value[:limit]}…'
+
+
+# 写入线程自身的错误日志
+_logger = logging.getLogger(__name__)
+
+# 文本日志与 JSONL 共用的日志器，文件处理器由各目录的写入线程持有
+_audit_log = logging.getLogger('template_filler.audit')
+_console_handler: Optional[logging.Handler] = None
+
+
+def _formatter() -> logging.Formatter:
+    return logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+
+class _AuditWriter:
+    """
+    同一日志目录共用的写入线程
+    
+    各 AuditLogger 只入队，由单个线程凑批追加到当天的 JSONL 文件并写入文本日志；
+    文件名按批次计算，跨天后自动切换到新文件。
+    """
+    
+    # 每累计多少条操作记录刷新一次 JSONL 缓冲区
+    FLUSH_EVERY = 32
+    # 每批最多合并的记录数，以及凑批的最长等待时间（秒）
+    BATCH_SIZE = 64
+    BATCH_WAIT = 0.05
+    # JSONL 文件写缓冲大小
+    BUFFER_SIZE = 64 * 1024
+    # flush 等待写入线程处理的最长时间（秒）
+    FLUSH_TIMEOUT = 10.0
+    
+    def __init__(self, log_dir: Path):
+        self.log_dir = log_dir
+        self.jsonl_file: Optional[Path] = None
+        self._jsonl_fh = None
+        self._jsonl_offset = 0
+        self._file_handler: Optional[logging.FileHandler] = None
+        self._pending = 0
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 操作 ID -> (JSONL 文件, 偏移, 长度)
+        self.index: Dict[str, Tuple[Path, int, int]] = {}
+    
+    def put(self, item: Any) -> None:
+        """入队一项（操作记录或 flush 请求），写入线程未运行（或已关闭）时启动"""
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='template_filler.audit_writer',
+                    daemon=True
+                )
+                self._thread.start()
+            self._queue.put(item)
+    
+    def flush(self) -> None:
+        """等待已入队的操作记录写入磁盘（最多等待 FLUSH_TIMEOUT 秒）"""
+        if self._thread is None:
+            return
+        event = threading.Event()
+        self.put(event)
+        if not event.wait(self.FLUSH_TIMEOUT):
+            _logger.warning("Audit log flush timed out after %.0fs", self.FLUSH_TIMEOUT)
+    
+    def close(self) -> None:
+        """写完剩余记录、关闭文件并停止写入线程"""
+        with self._lock:
+            thread = self._thread
+            if thread and thread.is_alive():
+                self._queue.put(None)
+        if thread:
+            thread.join()
+    
+    def active_files(self) -> Set[str]:
+        """正在写入的 JSONL 与文本日志文件名"""
+        with self._lock:
+            if self.jsonl_file is None:
+                return set()
+            return {self.jsonl_file.name, self.jsonl_file.with_suffix('.log').name}
+    
+    def prune_index(self) -> None:
+        """移除指向已删除文件的索引项"""
+        with self._lock:
+            self.index = {
+                op_id: location for op_id, location in self.index.items()
+                if location[0].exists()
+            }
+    
+    def _run(self) -> None:
+        """写入线程：从队列凑批后一次性追加到 JSONL 文件"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.BATCH_WAIT
+            # 遇到 flush/close 请求时立即处理，不再等待凑批
+            while len(batch) < self.BATCH_SIZE and isinstance(batch[-1], tuple):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            running = True
+            try:
+                running = self._write_batch(batch)
+            except Exception:
+                # 写盘失败（如日志目录被删除）时丢弃本批记录，下一批重新打开文件
+                _logger.exception("Failed to write audit log batch to %s", self.log_dir)
+                with contextlib.suppress(OSError):
+                    self._close_files()
+                running = not any(item is None for item in batch)
+            finally:
+                # 无论成败都唤醒等待的 flush，避免其永久阻塞
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+            
+            if not running:
+                return
+    
+    def _roll(self) -> None:
+        """按当天日期打开 JSONL 与文本日志文件，日期未变时沿用已打开的文件"""
+        day = datetime.now().strftime('%Y%m%d')
+        jsonl_file = self.log_dir / f"audit_{day}.jsonl"
+        if jsonl_file == self.jsonl_file:
+            return
+        
+        self._close_files()
+        fh = open(jsonl_file, 'ab', buffering=self.BUFFER_SIZE)
+        file_handler = logging.FileHandler(jsonl_file.with_suffix('.log'), encoding='utf-8')
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(_formatter())
+        with self._lock:
+            self.jsonl_file = jsonl_file
+            self._jsonl_fh = fh
+            self._jsonl_offset = fh.tell()
+            self._file_handler = file_handler
+    
+    def _close_files(self) -> None:
+        """关闭当前的 JSONL 与文本日志文件"""
+        with self._lock:
+            fh, self._jsonl_fh = self._jsonl_fh, None
+            file_handler, self._file_handler = self._file_handler, None
+            self.jsonl_file = None
+        if fh:
+            fh.close()
+        if file_handler:
+            file_handler.close()
+        self._pending = 0
+    
+    def _write_batch(self, batch: List[Any]) -> bool:
+        """
+        写入一批队列项
+        
+        队列项为 (操作 ID, JSONL 行, 文本日志) 元组、flush 请求（Event）或停止标记（None）；
+        flush 请求由 _run 统一唤醒。
+        
+        Returns:
+            写入线程是否继续运行
+        """
+        records = [item for item in batch if isinstance(item, tuple)]
+        waiters = [item for item in batch if isinstance(item, threading.Event)]
+        stop = any(item is None for item in batch)
+        
+        if records:
+            self._roll()
+            with self._lock:
+                for operation_id, line, _ in records:
+                    self.index[operation_id] = (self.jsonl_file, self._jsonl_offset, len(line))
+                    self._jsonl_offset += len(line)
+            
+            self._jsonl_fh.writelines(line for _, line, _ in records)
+            self._pending += len(records)
+        
+        if self._jsonl_fh and (self._pending >= self.FLUSH_EVERY or waiters or stop):
+            self._jsonl_fh.flush()
+            self._pending = 0
+        
+        # 文本日志：写入本目录的文件，并交给日志器的其他处理器（控制台等）
+        for _, _, messages in records:
+            for level, message in messages:
+                if not _audit_log.isEnabledFor(level):
+                    continue
+                record = _audit_log.makeRecord(_audit_log.name, level, __file__, 0, message, None, None)
+                self._file_handler.handle(record)
+                # 没有其他处理器时不交给日志器，以免 lastResort 把错误打到 stderr
+                if _audit_log.hasHandlers():
+                    _audit_log.handle(record)
+        
+        if stop:
+            self._close_files()
+            return False
+        return True
+
+
+# 日志目录 -> 共享写入线程，进程退出时统一写完
+_writers: Dict[Path, _AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def _get_writer(log_dir: Path) -> _AuditWriter:
+    """获取日志目录对应的共享写入线程"""
+    path = log_dir.resolve()
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _AuditWriter(path)
+        return writer
+
+
+@atexit.register
+def _close_all() -> None:
+    for writer in list(_writers.values()):
+        writer.close()
+
 
 class AuditLogger:
     """操作日志记录器"""
     
+    # 读取最近操作时，从文件尾部最多回读的字节数
+    TAIL_BYTES = 1024 * 1024
+    
     def __init__(
         self,
         log_dir: Optional[str] = None,
@@ -25,45 +258,54 @@ class AuditLogger:
         """
         初始化日志记录器
         
+        同一日志目录的多个实例共用一个写入线程。
+        
         Args:
-            log_dir: 日志目录，默认为 ~/.template_filler/logs
+            log_dir: 日志目录，默认为 $TEMPLATE_FILLER_HOME/logs（~/.template_filler/logs）
             enabled: 是否启用日志
             console_output: 是否同时输出到控制台
         """
         self.enabled = enabled
         self.console_output = console_output
+        self._writer: Optional[_AuditWriter] = None
+        # JSONL 文件名 -> (文件大小, 记录数)，文件未变化时复用计数
+        self._line_counts: Dict[str, Tuple[int, int]] = {}
         
         if log_dir:
             self.log_dir = Path(log_dir)
         else:
-            self.log_dir = Path.home() / ".template_filler" / "logs"
+            self.log_dir = BASE_DIR / "logs"
         
         if self.enabled:
-            self.log_dir.mkdir(parents=True, exist_ok=True)
+            ensure_dir(self.log_dir)
             self._setup_logger()
     
     def _setup_logger(self):
-        """设置 Python 日志器"""
-        self.logger = logging.getLogger('template_filler.audit')
+        """设置 Python 日志器并获取日志目录的写入线程"""
+        global _console_handler
+        
+        self.logger = _audit_log
         self.logger.setLevel(logging.INFO)
         
-        # 文件处理器
-        log_file = self.log_dir / f"audit_{datetime.now().strftime('%Y%m%d')}.log"
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
-        ))
-        self.logger.addHandler(file_handler)
-        
-        # 控制台处理器
-        if self.console_output:
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.INFO)
-            console_handler.setFormatter(logging.Formatter(
-                '%(asctime)s - %(levelname)s - %(message)s'
-            ))
-            self.logger.addHandler(console_handler)
+        # 控制台处理器（多个实例只添加一次）
+        if self.console_output and _console_handler is None:
+            _console_handler = logging.StreamHandler()
+            _console_handler.setLevel(logging.INFO)
+            _console_handler.setFormatter(_formatter())
+            self.logger.addHandler(_console_handler)
+        
+        # 操作明细：按天滚动的追加式 JSONL 文件，由共享写入线程打开
+        self._writer = _get_writer(self.log_dir)
+    
+    def flush(self) -> None:
+        """等待已入队的操作记录写入磁盘"""
+        if self._writer:
+            self._writer.flush()
+    
+    def close(self) -> None:
+        """写完剩余记录并关闭 JSONL 文件（之后再记录操作会重新打开）"""
+        if self._writer:
+            self._writer.close()
     
     def log_operation(
         self,
@@ -101,7 +343,7 @@ class AuditLogger:
             'operation': operation,
             'template': template_name,
             'placeholders': placeholders,
-            'context_preview': context_preview[:200] + '...' if len(context_preview) > 200 else context_preview,
+            'context_preview': _preview(context_preview, 200),
             'status': 'error' if error else 'success',
             'error': error,
             'metadata': metadata or {}
@@ -109,28 +351,90 @@ class AuditLogger:
         
         # 记录结果（截断过长内容）
         if result:
-            log_entry['result_preview'] = {
-                k: v[:100] + '...' if len(v) > 100 else v
-                for k, v in result.items()
-            }
+            # 结果都不超长时直接引用原字典（随即序列化，不会被修改）
+            if any(len(v) > 100 for v in result.values()):
+                log_entry['result_preview'] = {k: _preview(v, 100) for k, v in result.items()}
+            else:
+                log_entry['result_preview'] = result
         
-        # 写入 JSON 日志文件
-        detail_file = self.log_dir / f"operation_{operation_id}.json"
-        with open(detail_file, 'w', encoding='utf-8') as f:
-            json.dump(log_entry, f, ensure_ascii=False, indent=2)
+        # JSONL 日志（每行一条紧凑 JSON）
+        line = json_codec.dumps(log_entry) + b'\n'
         
-        # 写入文本日志
+        # 文本日志
         status = 'ERROR' if error else 'SUCCESS'
-        self.logger.info(
+        messages = [(logging.INFO, (
             f"[{operation_id}] {operation.upper()} | {template_name} | "
             f"{len(placeholders)} placeholders | {status}"
-        )
-        
+        ))]
         if error:
-            self.logger.error(f"[{operation_id}] Error: {error}")
+            messages.append((logging.ERROR, f"[{operation_id}] Error: {error}"))
+        
+        self._writer.put((operation_id, line, messages))
         
         return operation_id
     
+    def get_operation(self, operation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按 ID 获取本进程记录的操作
+        
+        Args:
+            operation_id: 操作 ID
+            
+        Returns:
+            操作记录，不存在则返回 None
+        """
+        if not self._writer:
+            return None
+        
+        self.flush()
+        location = self._writer.index.get(operation_id)
+        if not location:
+            return None
+        
+        path, offset, length = location
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return json_codec.loads(f.read(length))
+        except (ValueError, IOError):
+            return None
+    
+    def _tail_lines(self, path: Path, count: int) -> List[bytes]:
+        """读取 JSONL 文件末尾的若干行"""
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(0, size - self.TAIL_BYTES)
+            f.seek(start)
+            data = f.read()
+        
+        lines = data.splitlines()
+        # 从文件中间开始读取时，第一行可能不完整
+        if start > 0 and lines:
+            lines = lines[1:]
+        return lines[-count:]
+    
+    def _scan(self, prefix: str, suffix: str) -> List[os.DirEntry]:
+        """列出日志目录中匹配前缀和后缀的文件"""
+        with os.scandir(self.log_dir) as it:
+            return [
+                e for e in it
+                if e.name.startswith(prefix) and e.name.endswith(suffix) and e.is_file()
+            ]
+    
+    def _count_lines(self, entry: os.DirEntry) -> int:
+        """统计 JSONL 文件中的记录数（按文件大小缓存）"""
+        size = entry.stat().st_size
+        cached = self._line_counts.get(entry.name)
+        if cached and cached[0] == size:
+            return cached[1]
+        
+        count = 0
+        with open(entry.path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                count += chunk.count(b'\n')
+        self._line_counts[entry.name] = (size, count)
+        return count
+    
     def get_recent_operations(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
         获取最近的操作记录
@@ -141,24 +445,29 @@ class AuditLogger:
         Returns:
             操作记录列表
         """
-        if not self.log_dir.exists():
+        if not self.log_dir.exists() or limit <= 0:
             return []
         
-        operation_files = sorted(
-            self.log_dir.glob("operation_*.json"),
-            key=lambda f: f.stat().st_mtime,
-            reverse=True
-        )[:limit]
+        self.flush()
+        
+        # 文件名包含日期，按名称倒序即从新到旧；每个文件至少一条记录，最多需要 limit 个文件
+        entries = heapq.nlargest(limit, self._scan("audit_", ".jsonl"), key=lambda e: e.name)
         
         operations = []
-        for f in operation_files:
+        for entry in entries:
             try:
-                with open(f, 'r', encoding='utf-8') as file:
-                    operations.append(json.load(file))
-            except (json.JSONDecodeError, IOError):
-                pass
+                lines = self._tail_lines(Path(entry.path), limit - len(operations))
+            except IOError:
+                continue
+            for line in reversed(lines):
+                try:
+                    operations.append(json_codec.loads(line))
+                except ValueError:
+                    pass
+            if len(operations) >= limit:
+                break
         
-        return operations
+        return operations[:limit]
     
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -170,13 +479,15 @@ class AuditLogger:
         if not self.log_dir.exists():
             return {'total_operations': 0, 'log_dir': str(self.log_dir)}
         
-        operation_files = list(self.log_dir.glob("operation_*.json"))
-        log_files = list(self.log_dir.glob("audit_*.log"))
+        self.flush()
         
-        total_size = sum(f.stat().st_size for f in operation_files + log_files)
+        operation_files = self._scan("audit_", ".jsonl")
+        log_files = self._scan("audit_", ".log")
+        
+        total_size = sum(e.stat().st_size for e in operation_files + log_files)
         
         return {
-            'total_operations': len(operation_files),
+            'total_operations': sum(self._count_lines(e) for e in operation_files),
             'log_files': len(log_files),
             'size_bytes': total_size,
             'size_mb': round(total_size / 1024 / 1024, 2),
@@ -196,14 +507,20 @@ class AuditLogger:
         if not self.log_dir.exists():
             return 0
         
-        cutoff = datetime.now().timestamp() - (days * 24 * 3600)
+        cutoff = time.time() - (days * 24 * 3600)
         count = 0
+        # 写入线程正在追加的当天文件即使长时间未更新也不删除
+        active = self._writer.active_files() if self._writer else set()
         
-        for f in self.log_dir.glob("*"):
-            if f.stat().st_mtime < cutoff:
-                f.unlink()
+        for entry in self._scan("", ""):
+            if entry.name not in active and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                self._line_counts.pop(entry.name, None)
                 count += 1
         
+        if self._writer:
+            self._writer.prune_index()
+        
         return count
 
 
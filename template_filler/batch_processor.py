@@ -5,13 +5,13 @@ BatchProcessor: 批量处理器
 """
 
 import os
+import asyncio
 from pathlib import Path
 from typing import List, Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 
 from .orchestrator import Orchestrator
-from .llm_client import LLMClient
+from .llm_client import LLMClient, run_and_close
 from .audit_logger import AuditLogger
 
 
@@ -57,39 +57,41 @@ class BatchProcessor:
         Returns:
             处理结果列表
         """
-        results = []
+        return asyncio.run(run_and_close(self.process_multiple_contexts_async(
+            template_path, contexts, schema, output_prefix
+        )))
+    
+    async def process_multiple_contexts_async(
+        self,
+        template_path: str,
+        contexts: List[str],
+        schema: Dict[str, Any],
+        output_prefix: str = "output"
+    ) -> List[Dict[str, Any]]:
+        """process_multiple_contexts 的异步版本"""
+        semaphore = asyncio.Semaphore(self.max_workers)
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
-            
-            for i, context in enumerate(contexts):
-                output_path = self.output_dir / f"{output_prefix}_{i + 1}.docx"
-                future = executor.submit(
-                    self._process_single,
-                    template_path,
-                    context,
-                    schema,
-                    str(output_path),
-                    i + 1
+        async def run(idx: int, context: str) -> Dict[str, Any]:
+            output_path = self.output_dir / f"{output_prefix}_{idx + 1}.docx"
+            try:
+                result = await self._bounded(
+                    semaphore, template_path, context, schema, str(output_path), idx + 1
                 )
-                futures[future] = i
-            
-            for future in as_completed(futures):
-                idx = futures[future]
-                try:
-                    result = future.result()
-                    results.append({
-                        'index': idx,
-                        'success': True,
-                        'output_path': result['output_path'],
-                        'placeholders': result['filled_placeholders']
-                    })
-                except Exception as e:
-                    results.append({
-                        'index': idx,
-                        'success': False,
-                        'error': str(e)
-                    })
+                return {
+                    'index': idx,
+                    'success': True,
+                    'output_path': result['output_path'],
+                    'placeholders': result['filled_placeholders']
+                }
+            except Exception as e:
+                return {
+                    'index': idx,
+                    'success': False,
+                    'error': str(e)
+                }
+        
+        tasks = [asyncio.create_task(run(i, context)) for i, context in enumerate(contexts)]
+        results = [await task for task in asyncio.as_completed(tasks)]
         
         # 按索引排序
         results.sort(key=lambda x: x['index'])
@@ -114,47 +116,57 @@ class BatchProcessor:
         Returns:
             处理结果列表
         """
-        results = []
+        return asyncio.run(run_and_close(self.process_multiple_templates_async(
+            template_paths, context, schemas, output_prefix
+        )))
+    
+    async def process_multiple_templates_async(
+        self,
+        template_paths: List[str],
+        context: str,
+        schemas: List[Dict[str, Any]],
+        output_prefix: str = "output"
+    ) -> List[Dict[str, Any]]:
+        """process_multiple_templates 的异步版本"""
+        semaphore = asyncio.Semaphore(self.max_workers)
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
-            
-            for i, (template_path, schema) in enumerate(zip(template_paths, schemas)):
-                template_name = Path(template_path).stem
-                output_path = self.output_dir / f"{output_prefix}_{template_name}.docx"
-                future = executor.submit(
-                    self._process_single,
-                    template_path,
-                    context,
-                    schema,
-                    str(output_path),
-                    i + 1
+        async def run(idx: int, template_path: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+            name = Path(template_path).stem
+            output_path = self.output_dir / f"{output_prefix}_{name}.docx"
+            try:
+                result = await self._bounded(
+                    semaphore, template_path, context, schema, str(output_path), idx + 1
                 )
-                futures[future] = (i, template_name)
-            
-            for future in as_completed(futures):
-                idx, name = futures[future]
-                try:
-                    result = future.result()
-                    results.append({
-                        'index': idx,
-                        'template': name,
-                        'success': True,
-                        'output_path': result['output_path'],
-                        'placeholders': result['filled_placeholders']
-                    })
-                except Exception as e:
-                    results.append({
-                        'index': idx,
-                        'template': name,
-                        'success': False,
-                        'error': str(e)
-                    })
+                return {
+                    'index': idx,
+                    'template': name,
+                    'success': True,
+                    'output_path': result['output_path'],
+                    'placeholders': result['filled_placeholders']
+                }
+            except Exception as e:
+                return {
+                    'index': idx,
+                    'template': name,
+                    'success': False,
+                    'error': str(e)
+                }
+        
+        tasks = [
+            asyncio.create_task(run(i, template_path, schema))
+            for i, (template_path, schema) in enumerate(zip(template_paths, schemas))
+        ]
+        results = [await task for task in asyncio.as_completed(tasks)]
         
         results.sort(key=lambda x: x['index'])
         return results
     
-    def _process_single(
+    async def _bounded(self, semaphore: asyncio.Semaphore, *args) -> Dict[str, Any]:
+        """在并发上限内执行单个任务"""
+        async with semaphore:
+            return await self._process_single_async(*args)
+    
+    async def _process_single_async(
         self,
         template_path: str,
         context: str,
@@ -165,14 +177,16 @@ class BatchProcessor:
         """处理单个任务"""
         print(f"[Batch] Processing task {task_id}...")
         
-        orchestrator = Orchestrator(
+        # 构造时会解析模板，放到线程中执行以免阻塞事件循环
+        orchestrator = await asyncio.to_thread(
+            Orchestrator,
             template_path=template_path,
             context=context,
             schema=schema,
             llm_client=self.llm_client
         )
         
-        result = orchestrator.run(output_path)
+        result = await orchestrator.run_async(output_path)
         
         # 记录日志
         self.audit_logger.log_operation(
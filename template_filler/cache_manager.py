@@ -2,14 +2,377 @@
 CacheManager: LLM 响应缓存系统
 
 缓存 LLM 生成的内容，避免重复调用，节省 Token 和时间。
+
+磁盘上每个缓存目录只有一个追加式日志文件 cache.bin，每条记录为
+定长头部（负载长度、创建时间戳、缓存键）+ 紧凑 JSON 负载。
+启动时只扫描头部即可重建 键 -> 偏移 索引，过期条目由后台线程定期 compact() 清理。
 """
 
 import os
-import json
+import time
+import atexit
+import logging
+import struct
 import hashlib
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from . import json_codec
+from .paths import BASE_DIR, ensure_dir
+
+
+logger = logging.getLogger(__name__)
+
+# 记录头：负载长度、创建时间戳、缓存键（32 位十六进制）
+_HEADER = struct.Struct('<Id32s')
+_HEX_DIGITS = frozenset(b'0123456789abcdef')
+
+# 缓存键哈希器原型，每次生成键时复制，省去重复构造
+_KEY_HASHER = hashlib.blake2b(digest_size=16, usedforsecurity=False)
+
+
+class _CacheLog:
+    """单个缓存目录的追加式日志，同一目录的多个 CacheManager 共享"""
+    
+    # 内存 LRU 缓存容量（条目数）
+    MEMORY_CAPACITY = 512
+    # 待写入记录达到条数或字节数阈值时批量落盘
+    MAX_BATCH_ENTRIES = 16
+    MAX_BATCH_BYTES = 256 * 1024
+    # 后台压缩的最短间隔（秒）
+    MIN_SWEEP_INTERVAL = 60
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        # key -> (记录偏移, 记录长度, 创建时间戳)
+        self._index: Dict[str, Tuple[int, int, float]] = {}
+        # 尚未落盘的记录：key -> (记录字节, 创建时间戳)
+        self._pending: Dict[str, Tuple[bytes, float]] = {}
+        self._pending_bytes = 0
+        # 内存 LRU：key -> (创建时间戳, 响应)
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # 已扫描进索引的文件长度
+        self._scanned = 0
+        self._read_fd: Optional[int] = None
+        self._write_fd: Optional[int] = None
+        # 索引和文件描述符对应的日志文件 (st_dev, st_ino)，用于发现其他进程的 compact / clear
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._sweeper: Optional[threading.Thread] = None
+        # 后台压缩使用的有效期：共享该日志的各 CacheManager 中最长的一个
+        self._sweep_ttl = 0.0
+        # 本进程内的查询命中 / 未命中次数（过期条目计为未命中）
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+    
+    def _open_fds(self) -> None:
+        """按需打开读写文件描述符"""
+        if self._write_fd is None:
+            self._write_fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            st = os.fstat(self._write_fd)
+            self._file_id = (st.st_dev, st.st_ino)
+        if self._read_fd is None:
+            self._read_fd = os.open(self.path, os.O_RDONLY)
+    
+    def _sync_file(self) -> Optional[os.stat_result]:
+        """
+        检查日志文件是否已被替换或删除（如其他进程 compact / clear）
+        
+        文件已变化时关闭旧文件描述符并清空索引，之后从头重新扫描；
+        尚未落盘的记录保留，下次 flush 写入新文件。
+        
+        Returns:
+            当前日志文件的 stat，文件不存在时返回 None
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        file_id = (st.st_dev, st.st_ino) if st is not None else None
+        if file_id != self._file_id:
+            self._close_fds()
+            self._index.clear()
+            self._scanned = 0
+            self._file_id = file_id
+        return st
+    
+    def _close_fds(self) -> None:
+        """关闭文件描述符"""
+        for fd in (self._read_fd, self._write_fd):
+            if fd is not None:
+                os.close(fd)
+        self._read_fd = None
+        self._write_fd = None
+    
+    def _scan(self) -> None:
+        """从上次扫描位置起读取记录头，更新索引（其他进程追加的记录也会被发现）"""
+        st = self._sync_file()
+        if st is None or st.st_size <= self._scanned:
+            return
+        size = st.st_size
+        
+        with open(self.path, 'rb') as f:
+            pos = self._scanned
+            f.seek(pos)
+            while pos + _HEADER.size <= size:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break  # 读取期间文件被截断
+                length, created_at, raw_key = _HEADER.unpack(header)
+                if not _HEX_DIGITS.issuperset(raw_key):
+                    # 记录头损坏，之后的内容无法定位，停止扫描
+                    logger.warning("Corrupt cache record at offset %d in %s", pos, self.path)
+                    break
+                end = pos + _HEADER.size + length
+                if end > size:
+                    break  # 尾部记录未完整写入
+                self._index[raw_key.decode('ascii')] = (pos, end - pos, created_at)
+                f.seek(length, os.SEEK_CUR)
+                pos = end
+        self._scanned = pos
+    
+    def _mem_put(self, key: str, created_at: float, response: str) -> None:
+        """写入内存 LRU，超出容量时淘汰最久未使用的条目"""
+        self._mem[key] = (created_at, response)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.MEMORY_CAPACITY:
+            self._mem.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """
+        读取记录
+        
+        Returns:
+            (创建时间戳, 响应)，不存在则返回 None
+        """
+        return self.get_many([key])[0]
+    
+    def get_many(self, keys: List[str]) -> List[Optional[Tuple[float, str]]]:
+        """
+        批量读取记录，只加锁、落盘和扫描一次
+        
+        Returns:
+            与 keys 一一对应的 (创建时间戳, 响应)，不存在的为 None
+        """
+        entries: List[Optional[Tuple[float, str]]] = [None] * len(keys)
+        records = []
+        
+        with self._lock:
+            missing = []
+            for i, key in enumerate(keys):
+                entry = self._mem.get(key)
+                if entry is not None:
+                    self._mem.move_to_end(key)
+                    entries[i] = entry
+                else:
+                    missing.append(i)
+            if not missing:
+                return entries
+            
+            if any(keys[i] in self._pending for i in missing):
+                self.flush()
+            if self._read_fd is None:
+                # 即将重新打开文件，先确认索引仍对应当前文件
+                self._sync_file()
+            if any(keys[i] not in self._index for i in missing):
+                self._scan()
+            
+            self._open_fds()
+            for i in missing:
+                location = self._index.get(keys[i])
+                if location is not None:
+                    offset, length, created_at = location
+                    records.append((i, created_at, length, os.pread(self._read_fd, length, offset)))
+        
+        loaded = []
+        for i, created_at, length, record in records:
+            key = keys[i]
+            if len(record) != length or record[_HEADER.size - 32:_HEADER.size] != key.encode('ascii'):
+                continue
+            try:
+                data = json_codec.loads(record[_HEADER.size:])
+            except ValueError:
+                continue
+            
+            response = data.get('response')
+            if response is None:
+                continue
+            entries[i] = (created_at, response)
+            loaded.append((key, created_at, response))
+        
+        if loaded:
+            with self._lock:
+                for key, created_at, response in loaded:
+                    self._mem_put(key, created_at, response)
+        return entries
+    
+    def put(self, key: str, created_at: float, payload: Dict[str, Any]) -> None:
+        """追加一条记录，达到批量阈值时落盘"""
+        body = json_codec.dumps(payload)
+        record = _HEADER.pack(len(body), created_at, key.encode('ascii')) + body
+        
+        with self._lock:
+            old = self._pending.pop(key, None)
+            if old is not None:
+                self._pending_bytes -= len(old[0])
+            self._pending[key] = (record, created_at)
+            self._pending_bytes += len(record)
+            self._mem_put(key, created_at, payload['response'])
+            
+            if (len(self._pending) >= self.MAX_BATCH_ENTRIES
+                    or self._pending_bytes >= self.MAX_BATCH_BYTES):
+                self.flush()
+    
+    def flush(self) -> None:
+        """将待写入记录一次性追加到日志文件"""
+        with self._lock:
+            if not self._pending:
+                return
+            
+            # 日志已被其他进程替换时改为写入新文件，而不是已删除的旧 inode
+            self._sync_file()
+            self._open_fds()
+            data = b''.join(record for record, _ in self._pending.values())
+            view = memoryview(data)
+            while view:
+                written = os.write(self._write_fd, view)
+                view = view[written:]
+            # O_APPEND 写入后文件偏移位于本次数据末尾
+            end = os.lseek(self._write_fd, 0, os.SEEK_CUR)
+            pos = end - len(data)
+            if pos == self._scanned:
+                self._scanned = end
+            
+            for key, (record, created_at) in self._pending.items():
+                self._index[key] = (pos, len(record), created_at)
+                pos += len(record)
+            self._pending.clear()
+            self._pending_bytes = 0
+    
+    def compact(self, ttl_seconds: float) -> int:
+        """
+        重写日志，只保留未过期的最新记录
+        
+        Returns:
+            丢弃的过期条目数量
+        """
+        with self._lock:
+            self.flush()
+            self._scan()
+            cutoff = time.time() - ttl_seconds
+            live = [(k, loc) for k, loc in self._index.items() if loc[2] >= cutoff]
+            dropped = len(self._index) - len(live)
+            if not dropped:
+                return 0
+            
+            self._open_fds()
+            tmp_path = self.path.with_suffix('.tmp')
+            new_index = {}
+            pos = 0
+            with open(tmp_path, 'wb') as f:
+                for key, (offset, length, created_at) in live:
+                    f.write(os.pread(self._read_fd, length, offset))
+                    new_index[key] = (pos, length, created_at)
+                    pos += length
+            os.replace(tmp_path, self.path)
+            
+            self._close_fds()
+            st = os.stat(self.path)
+            self._file_id = (st.st_dev, st.st_ino)
+            self._index = new_index
+            self._scanned = pos
+            for key in [k for k, (created_at, _) in self._mem.items() if created_at < cutoff]:
+                del self._mem[key]
+            return dropped
+    
+    def start_sweeper(self, ttl_seconds: float) -> None:
+        """
+        启动后台线程，定期压缩日志以清理过期条目（仅启动一次）
+        
+        多个 CacheManager 共享同一日志时按其中最长的有效期压缩，
+        不会删除仍在其他管理器有效期内的条目。
+        """
+        with self._lock:
+            self._sweep_ttl = max(self._sweep_ttl, ttl_seconds)
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop,
+                name='template_filler.cache_sweeper',
+                daemon=True
+            )
+            self._sweeper.start()
+    
+    def _sweep_loop(self) -> None:
+        """后台压缩循环"""
+        while True:
+            time.sleep(max(self._sweep_ttl / 10, self.MIN_SWEEP_INTERVAL))
+            try:
+                self.compact(self._sweep_ttl)
+            except Exception:
+                logger.exception("Cache compaction failed for %s", self.path)
+    
+    def clear(self) -> int:
+        """
+        删除所有记录
+        
+        Returns:
+            删除的条目数量
+        """
+        with self._lock:
+            self._scan()
+            count = len(self._index.keys() | self._pending.keys())
+            self._index.clear()
+            self._pending.clear()
+            self._pending_bytes = 0
+            self._mem.clear()
+            self._close_fds()
+            self._scanned = 0
+            self._file_id = None
+            if self.path.exists():
+                self.path.unlink()
+            return count
+    
+    def record_lookups(self, hits: int, misses: int) -> None:
+        """累加查询命中 / 未命中次数"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+    
+    def stats(self) -> Tuple[int, int]:
+        """
+        Returns:
+            (条目数量, 日志文件字节数)
+        """
+        with self._lock:
+            self.flush()
+            self._scan()
+            size = self.path.stat().st_size if self.path.exists() else 0
+            return len(self._index), size
+
+
+# 缓存目录 -> 共享日志，进程退出时统一刷新
+_logs: Dict[Path, _CacheLog] = {}
+_logs_lock = threading.Lock()
+
+
+def _get_log(cache_dir: Path) -> _CacheLog:
+    """获取缓存目录对应的共享日志"""
+    path = (cache_dir / "cache.bin").resolve()
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = _CacheLog(path)
+        return log
+
+
+@atexit.register
+def _flush_all() -> None:
+    for log in list(_logs.values()):
+        log.flush()
 
 
 class CacheManager:
@@ -25,20 +388,23 @@ class CacheManager:
         初始化缓存管理器
         
         Args:
-            cache_dir: 缓存目录，默认为 ~/.template_filler/cache
+            cache_dir: 缓存目录，默认为 $TEMPLATE_FILLER_HOME/cache（~/.template_filler/cache）
             ttl_hours: 缓存有效期（小时）
             enabled: 是否启用缓存
         """
         self.enabled = enabled
         self.ttl_hours = ttl_hours
+        self._ttl_seconds = ttl_hours * 3600
         
         if cache_dir:
             self.cache_dir = Path(cache_dir)
         else:
-            self.cache_dir = Path.home() / ".template_filler" / "cache"
+            self.cache_dir = BASE_DIR / "cache"
         
+        self._log: Optional[_CacheLog] = None
         if self.enabled:
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            ensure_dir(self.cache_dir)
+            self._log = _get_log(self.cache_dir)
     
     def _generate_key(self, prompt: str, model: str = "", system_prompt: str = "") -> str:
         """
@@ -48,12 +414,31 @@ class CacheManager:
             prompt: 用户 prompt
             model: 模型名称
             system_prompt: 系统 prompt
-            
+        
         Returns:
-            缓存键（MD5 哈希）
+            缓存键（BLAKE2b 哈希，128 位）
         """
-        content = f"{model}|{system_prompt}|{prompt}"
-        return hashlib.md5(content.encode()).hexdigest()
+        h = _KEY_HASHER.copy()
+        h.update(model.encode())
+        h.update(b'|')
+        h.update(system_prompt.encode())
+        h.update(b'|')
+        h.update(prompt.encode())
+        return h.hexdigest()
+    
+    def make_key(self, prompt: str, model: str = "", system_prompt: str = "") -> str:
+        """
+        生成缓存键，供调用方在 get_by_key / set_by_key 之间复用
+        
+        Args:
+            prompt: 用户 prompt
+            model: 模型名称
+            system_prompt: 系统 prompt
+        
+        Returns:
+            缓存键
+        """
+        return self._generate_key(prompt, model, system_prompt)
     
     def get(self, prompt: str, model: str = "", system_prompt: str = "") -> Optional[str]:
         """
@@ -63,32 +448,59 @@ class CacheManager:
             prompt: 用户 prompt
             model: 模型名称
             system_prompt: 系统 prompt
-            
+        
         Returns:
             缓存的响应，如果没有或已过期则返回 None
         """
         if not self.enabled:
             return None
+        return self.get_by_key(self._generate_key(prompt, model, system_prompt))
+    
+    def get_by_key(self, key: str) -> Optional[str]:
+        """
+        按缓存键获取响应
         
-        key = self._generate_key(prompt, model, system_prompt)
-        cache_file = self.cache_dir / f"{key}.json"
+        Args:
+            key: make_key 生成的缓存键
         
-        if not cache_file.exists():
+        Returns:
+            缓存的响应，如果没有或已过期则返回 None
+        """
+        if not self.enabled:
             return None
         
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 检查是否过期
-            created_at = datetime.fromisoformat(data.get('created_at', ''))
-            if datetime.now() - created_at > timedelta(hours=self.ttl_hours):
-                cache_file.unlink()  # 删除过期缓存
-                return None
-            
-            return data.get('response')
-        except (json.JSONDecodeError, ValueError, KeyError):
+        entry = self._log.get(key)
+        # 检查是否过期（过期记录由 compact() 清理）
+        if entry is None or time.time() - entry[0] > self._ttl_seconds:
+            self._log.record_lookups(0, 1)
             return None
+        
+        self._log.record_lookups(1, 0)
+        return entry[1]
+    
+    def get_many(self, requests: List[Tuple[str, str]], model: str = "") -> List[Optional[str]]:
+        """
+        批量获取缓存的响应
+        
+        Args:
+            requests: (用户 prompt, 系统 prompt) 列表
+            model: 模型名称
+        
+        Returns:
+            与 requests 一一对应的响应，没有或已过期的为 None
+        """
+        if not self.enabled:
+            return [None] * len(requests)
+        
+        keys = [self._generate_key(prompt, model, system_prompt) for prompt, system_prompt in requests]
+        now = time.time()
+        responses = [
+            entry[1] if entry is not None and now - entry[0] <= self._ttl_seconds else None
+            for entry in self._log.get_many(keys)
+        ]
+        hits = len(responses) - responses.count(None)
+        self._log.record_lookups(hits, len(responses) - hits)
+        return responses
     
     def set(self, prompt: str, response: str, model: str = "", system_prompt: str = "") -> None:
         """
@@ -102,36 +514,58 @@ class CacheManager:
         """
         if not self.enabled:
             return
+        self.set_by_key(self._generate_key(prompt, model, system_prompt), prompt, response, model)
+    
+    def set_by_key(self, key: str, prompt: str, response: str, model: str = "") -> None:
+        """
+        按缓存键存储响应
         
-        key = self._generate_key(prompt, model, system_prompt)
-        cache_file = self.cache_dir / f"{key}.json"
+        Args:
+            key: make_key 生成的缓存键
+            prompt: 用户 prompt（截断后保存，仅供查看）
+            response: LLM 响应
+            model: 模型名称
+        """
+        if not self.enabled:
+            return
         
         data = {
-            'prompt': prompt[:200] + '...' if len(prompt) > 200 else prompt,  # 截断长 prompt
+            'prompt': prompt if len(prompt) <= 200 else f'{prompt[:200]}…',  # 截断长 prompt
             'response': response,
-            'model': model,
-            'created_at': datetime.now().isoformat()
+            'model': model
         }
         
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._log.put(key, time.time(), data)
+        self._log.start_sweeper(self._ttl_seconds)
+    
+    def flush(self) -> None:
+        """将缓冲的缓存记录写入磁盘"""
+        if self._log:
+            self._log.flush()
+    
+    def compact(self) -> int:
+        """
+        压缩缓存日志，删除过期条目
+        
+        Returns:
+            删除的过期条目数量
+        """
+        if not self._log:
+            return 0
+        return self._log.compact(self._ttl_seconds)
     
     def clear(self) -> int:
         """
         清除所有缓存
         
         Returns:
-            删除的缓存文件数量
+            删除的缓存条目数量
         """
         if not self.cache_dir.exists():
             return 0
         
-        count = 0
-        for cache_file in self.cache_dir.glob("*.json"):
-            cache_file.unlink()
-            count += 1
-        
-        return count
+        log = self._log or _get_log(self.cache_dir)
+        return log.clear()
     
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -141,16 +575,20 @@ class CacheManager:
             统计信息字典
         """
         if not self.cache_dir.exists():
-            return {'count': 0, 'size_bytes': 0}
+            return {'count': 0, 'size_bytes': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
         
-        files = list(self.cache_dir.glob("*.json"))
-        total_size = sum(f.stat().st_size for f in files)
+        log = self._log or _get_log(self.cache_dir)
+        count, total_size = log.stats()
+        lookups = log.hits + log.misses
         
         return {
-            'count': len(files),
+            'count': count,
             'size_bytes': total_size,
             'size_mb': round(total_size / 1024 / 1024, 2),
-            'cache_dir': str(self.cache_dir)
+            'cache_dir': str(self.cache_dir),
+            'hits': log.hits,
+            'misses': log.misses,
+            'hit_rate': round(log.hits / lookups, 4) if lookups else 0.0
         }
 
 
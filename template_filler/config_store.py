@@ -5,12 +5,13 @@ ConfigStore: 配置存储
 """
 
 import os
-import json
-import hashlib
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from . import json_codec
+from .paths import BASE_DIR, ensure_dir
+
 
 class ConfigStore:
     """配置存储管理器"""
@@ -20,29 +21,46 @@ class ConfigStore:
         初始化配置存储
         
         Args:
-            storage_dir: 存储目录，默认为 ~/.template_filler/configs
+            storage_dir: 存储目录，默认为 $TEMPLATE_FILLER_HOME/configs（~/.template_filler/configs）
         """
         if storage_dir:
             self.storage_dir = Path(storage_dir)
         else:
-            self.storage_dir = Path.home() / ".template_filler" / "configs"
+            self.storage_dir = BASE_DIR / "configs"
         
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        ensure_dir(self.storage_dir)
         self.index_file = self.storage_dir / "index.json"
         self._load_index()
     
+    def _index_mtime(self) -> Optional[int]:
+        """索引文件的修改时间（纳秒），文件不存在时返回 None"""
+        try:
+            return os.stat(self.index_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
     def _load_index(self):
         """加载配置索引"""
-        if self.index_file.exists():
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                self.index = json.load(f)
+        # 索引变化后已排序的列表结果失效
+        self._listings: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self._index_mtime_ns = self._index_mtime()
+        if self._index_mtime_ns is not None:
+            self.index = json_codec.loads(self.index_file.read_bytes())
         else:
             self.index = {"configs": {}}
     
+    def _maybe_reload_index(self):
+        """索引文件被其他进程修改时重新加载"""
+        if self._index_mtime() != self._index_mtime_ns:
+            self._load_index()
+    
     def _save_index(self):
-        """保存配置索引"""
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        """保存配置索引（紧凑格式，写临时文件后原子替换）"""
+        tmp_file = self.index_file.with_suffix('.json.tmp')
+        tmp_file.write_bytes(json_codec.dumps(self.index))
+        os.replace(tmp_file, self.index_file)
+        self._index_mtime_ns = self._index_mtime()
+        self._listings = {}
     
     def _generate_id(self, name: str) -> str:
         """生成配置 ID"""
@@ -71,6 +89,7 @@ class ConfigStore:
         Returns:
             配置 ID
         """
+        self._maybe_reload_index()
         config_id = self._generate_id(name)
         
         config_data = {
@@ -84,8 +103,7 @@ class ConfigStore:
         
         # 保存到文件
         config_file = self.storage_dir / f"{config_id}.json"
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=2)
+        config_file.write_bytes(json_codec.dumps(config_data, indent=True))
         
         # 更新索引
         self.index["configs"][config_id] = {
@@ -108,15 +126,15 @@ class ConfigStore:
         Returns:
             配置数据
         """
+        self._maybe_reload_index()
         if config_id not in self.index["configs"]:
             return None
         
         config_file = self.storage_dir / f"{config_id}.json"
-        if not config_file.exists():
+        try:
+            return json_codec.loads(config_file.read_bytes())
+        except FileNotFoundError:
             return None
-        
-        with open(config_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
     
     def list_configs(self, template_name: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -128,15 +146,21 @@ class ConfigStore:
         Returns:
             配置列表
         """
-        configs = []
-        for config_id, info in self.index["configs"].items():
-            if template_name and info.get("template_name") != template_name:
-                continue
-            configs.append({
-                "id": config_id,
-                **info
-            })
-        return sorted(configs, key=lambda x: x.get("created_at", ""), reverse=True)
+        self._maybe_reload_index()
+        # 索引未变化时直接复用上次过滤、排序的结果
+        listing = self._listings.get(template_name or None)
+        if listing is None:
+            configs = []
+            for config_id, info in self.index["configs"].items():
+                if template_name and info.get("template_name") != template_name:
+                    continue
+                configs.append({
+                    "id": config_id,
+                    **info
+                })
+            listing = sorted(configs, key=lambda x: x.get("created_at", ""), reverse=True)
+            self._listings[template_name or None] = listing
+        return [dict(config) for config in listing]
     
     def delete(self, config_id: str) -> bool:
         """
@@ -148,6 +172,7 @@ class ConfigStore:
         Returns:
             是否成功
         """
+        self._maybe_reload_index()
         if config_id not in self.index["configs"]:
             return False
         
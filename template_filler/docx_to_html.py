@@ -4,9 +4,48 @@ DocxToHtml: DOCX 转 HTML 转换器（增强版）
 将 Word 文档转换为 HTML，尽可能保留原始格式和样式。
 """
 
+import io
+import os
 import re
+import mmap
+import hashlib
+import threading
 import mammoth
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# 转换结果缓存：(inode, mtime_ns, size, 样式映射哈希) -> (html, placeholders, messages)
+_DOCX_CACHE: Dict[Tuple[int, int, int, str], Tuple[str, List[str], List[str]]] = {}
+_DOCX_CACHE_SIZE = 32
+# fill_html 的切分结果缓存：转换缓存键 -> (源 html, [文本, 占位符名, 文本, ...])
+_SEGMENTS_CACHE: Dict[Tuple[int, int, int, str], Tuple[str, List[str]]] = {}
+# 服务端在线程池中转换，两个缓存的读写都在锁内进行
+_CACHE_LOCK = threading.Lock()
+
+
+class _MappedFile(io.RawIOBase):
+    """将 mmap 包装为可供 zipfile 读取的二进制文件对象"""
+    
+    def __init__(self, mm: mmap.mmap):
+        self._mm = mm
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        data = self._mm.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mm.seek(offset, whence)
+        return self._mm.tell()
+    
+    def tell(self) -> int:
+        return self._mm.tell()
 
 
 class DocxToHtml:
@@ -30,68 +69,10 @@ class DocxToHtml:
         td => td
         th => th
     """
+    _STYLE_MAP_HASH = hashlib.blake2b(STYLE_MAP.encode(), digest_size=8).hexdigest()
     
-    def __init__(self, file_path: str = None, file_obj=None):
-        """
-        初始化转换器
-        
-        Args:
-            file_path: DOCX 文件路径
-            file_obj: 文件对象（二进制模式）
-        """
-        self.file_path = file_path
-        self.file_obj = file_obj
-        self.html = ""
-        self.placeholders = []
-    
-    def _transform_element(self, element):
-        """
-        自定义元素转换，保留更多样式信息
-        """
-        # 处理加粗
-        if element.bold:
-            return mammoth.transforms.bold(element)
-        # 处理斜体
-        if element.italic:
-            return mammoth.transforms.italic(element)
-        return element
-    
-    def convert(self) -> Dict[str, Any]:
-        """
-        转换 DOCX 为 HTML（增强格式保留）
-        
-        Returns:
-            包含 html 和 placeholders 的字典
-        """
-        convert_options = {
-            "style_map": self.STYLE_MAP,
-            "include_embedded_style_map": True,
-            "include_default_style_map": True,
-        }
-        
-        if self.file_path:
-            with open(self.file_path, 'rb') as f:
-                result = mammoth.convert_to_html(f, **convert_options)
-        elif self.file_obj:
-            result = mammoth.convert_to_html(self.file_obj, **convert_options)
-        else:
-            raise ValueError("需要提供 file_path 或 file_obj")
-        
-        # 添加增强样式
-        self.html = self._add_enhanced_styles(result.value)
-        self.placeholders = self._extract_placeholders(self.html)
-        
-        return {
-            'html': self.html,
-            'placeholders': self.placeholders,
-            'messages': [msg.message for msg in result.messages]
-        }
-    
-    def _add_enhanced_styles(self, html: str) -> str:
-        """
-        添加增强 CSS 样式以更好地显示文档
-        """
-        style_tag = """
+    # 增强 CSS 样式（常量，类加载时构建一次）
+    _STYLE_TAG = """
         <style>
             .docx-content {
                 font-family: 'Segoe UI', 'Microsoft YaHei', Arial, sans-serif;
@@ -144,7 +125,109 @@ class DocxToHtml:
             .docx-content p.indent { text-indent: 2em; }
         </style>
         """
-        return f'{style_tag}<div class="docx-content">{html}</div>'
+    _STYLE_PREFIX = _STYLE_TAG + '<div class="docx-content">'
+    _STYLE_SUFFIX = '</div>'
+    
+    # 填充内容高亮 span 的固定片段
+    _FILLED_PREFIX = '<span class="filled-content" data-name="'
+    _FILLED_MIDDLE = (
+        '" style="background: rgba(16, 185, 129, 0.15); '
+        'border-bottom: 2px solid #10b981; padding: 2px 4px; '
+        'border-radius: 2px;">'
+    )
+    _FILLED_SUFFIX = '</span>'
+    
+    def __init__(self, file_path: str = None, file_obj=None):
+        """
+        初始化转换器
+        
+        Args:
+            file_path: DOCX 文件路径
+            file_obj: 文件对象（二进制模式）
+        """
+        self.file_path = file_path
+        self.file_obj = file_obj
+        self.html = ""
+        self.placeholders = []
+        # fill_html 使用的切分结果：(源 html, [文本, 占位符名, 文本, ...])
+        self._segments: Optional[Tuple[str, List[str]]] = None
+        # 最近一次 convert 使用的缓存键（file_obj 转换时为 None）
+        self._cache_key: Optional[Tuple[int, int, int, str]] = None
+        # 本实例已转换的来源 (file_path, file_obj) 及转换消息，来源不变时 convert 直接返回
+        self._converted_from: Optional[Tuple[Optional[str], Any]] = None
+        self._messages: List[str] = []
+    
+    def convert(self) -> Dict[str, Any]:
+        """
+        转换 DOCX 为 HTML（增强格式保留）
+        
+        Returns:
+            包含 html 和 placeholders 的字典
+        """
+        converted = self._converted_from
+        if converted is not None and converted[0] == self.file_path and converted[1] is self.file_obj:
+            return self._result()
+        
+        convert_options = {
+            "style_map": self.STYLE_MAP,
+            "include_embedded_style_map": True,
+            "include_default_style_map": True,
+        }
+        
+        cache_key = None
+        if self.file_path:
+            # 文件未变化时直接复用转换结果
+            st = os.stat(self.file_path)
+            cache_key = (st.st_ino, st.st_mtime_ns, st.st_size, self._STYLE_MAP_HASH)
+            self._cache_key = cache_key
+            with _CACHE_LOCK:
+                cached = _DOCX_CACHE.get(cache_key)
+            if cached is not None:
+                self.html, placeholders, self._messages = cached
+                self.placeholders = list(placeholders)
+                self._converted_from = (self.file_path, self.file_obj)
+                return self._result()
+            
+            with open(self.file_path, 'rb') as f:
+                if st.st_size:
+                    # 内存映射文件，zip 读取直接访问页缓存，无需额外缓冲拷贝
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        result = mammoth.convert_to_html(_MappedFile(mm), **convert_options)
+                else:
+                    result = mammoth.convert_to_html(f, **convert_options)
+        elif self.file_obj:
+            result = mammoth.convert_to_html(self.file_obj, **convert_options)
+        else:
+            raise ValueError("需要提供 file_path 或 file_obj")
+        
+        # 添加增强样式
+        self.html = self._add_enhanced_styles(result.value)
+        self.placeholders = self._extract_placeholders(self.html)
+        messages = [msg.message for msg in result.messages]
+        
+        if cache_key is not None:
+            with _CACHE_LOCK:
+                if len(_DOCX_CACHE) >= _DOCX_CACHE_SIZE:
+                    _DOCX_CACHE.pop(next(iter(_DOCX_CACHE)), None)
+                _DOCX_CACHE[cache_key] = (self.html, list(self.placeholders), messages)
+        
+        self._messages = messages
+        self._converted_from = (self.file_path, self.file_obj)
+        return self._result()
+    
+    def _result(self) -> Dict[str, Any]:
+        """最近一次转换的结果"""
+        return {
+            'html': self.html,
+            'placeholders': self.placeholders,
+            'messages': list(self._messages)
+        }
+    
+    def _add_enhanced_styles(self, html: str) -> str:
+        """
+        添加增强 CSS 样式以更好地显示文档
+        """
+        return ''.join((self._STYLE_PREFIX, html, self._STYLE_SUFFIX))
     
     def convert_with_highlight(self) -> Dict[str, Any]:
         """
@@ -166,9 +249,8 @@ class DocxToHtml:
         }
     
     def _extract_placeholders(self, html: str) -> List[str]:
-        """提取所有占位符名称"""
-        matches = self.PLACEHOLDER_PATTERN.findall(html)
-        return list(set(matches))
+        """提取所有占位符名称（去重，保持出现顺序）"""
+        return list(dict.fromkeys(m.group(1) for m in self.PLACEHOLDER_PATTERN.finditer(html)))
     
     def _highlight_placeholders(self, html: str) -> str:
         """
@@ -199,19 +281,33 @@ class DocxToHtml:
         Returns:
             填充后的 HTML
         """
-        filled_html = self.html
-        for name, content in content_map.items():
-            pattern = f'{{{{{name}}}}}'
-            # 高亮填充内容
-            replacement = (
-                f'<span class="filled-content" data-name="{name}" '
-                f'style="background: rgba(16, 185, 129, 0.15); '
-                f'border-bottom: 2px solid #10b981; padding: 2px 4px; '
-                f'border-radius: 2px;">'
-                f'{content}</span>'
-            )
-            filled_html = filled_html.replace(pattern, replacement)
-        return filled_html
+        # 同一份 HTML 只切分一次，之后的填充不再扫描文本；
+        # 命中转换缓存时各实例的 html 是同一对象，切分结果也跨请求复用
+        if self._segments is None or self._segments[0] is not self.html:
+            cached = None
+            if self._cache_key:
+                with _CACHE_LOCK:
+                    cached = _SEGMENTS_CACHE.get(self._cache_key)
+            if cached is None or cached[0] is not self.html:
+                cached = (self.html, self.PLACEHOLDER_PATTERN.split(self.html))
+                if self._cache_key:
+                    with _CACHE_LOCK:
+                        if len(_SEGMENTS_CACHE) >= _DOCX_CACHE_SIZE:
+                            _SEGMENTS_CACHE.pop(next(iter(_SEGMENTS_CACHE)), None)
+                        _SEGMENTS_CACHE[self._cache_key] = cached
+            self._segments = cached
+        segments = self._segments[1]
+        
+        parts = list(segments)
+        for i in range(1, len(segments), 2):
+            name = segments[i]
+            content = content_map.get(name)
+            if content is None:
+                parts[i] = f'{{{{{name}}}}}'
+            else:
+                # 高亮填充内容
+                parts[i] = ''.join((self._FILLED_PREFIX, name, self._FILLED_MIDDLE, content, self._FILLED_SUFFIX))
+        return ''.join(parts)
 
 
 if __name__ == '__main__':
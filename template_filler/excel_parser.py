@@ -2,19 +2,81 @@
 ExcelParser: XLSX 模板解析与填充
 
 解析 Excel 文档中的 {{KEYWORD}} 占位符，并在保留格式的情况下替换内容。
+
+注意：需要完整序列化工作簿时不保留 VBA 宏（keep_vba=False）和外部链接（keep_links=False），
+模板应为普通 .xlsx 文件。
 """
 
 import re
+import shutil
+import zipfile
+import functools
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 from openpyxl import load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from openpyxl.workbook import Workbook
-from typing import Dict, List, Optional
-import copy
+from typing import Dict, List, Optional, Set, Tuple
+
+
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+# 共享字符串条目，及其中的纯文本 / 富文本片段
+_SI = f'{_MAIN_NS}si'
+_SI_TEXT = f'{_MAIN_NS}t'
+_SI_RUN_TEXT = f'{_MAIN_NS}r/{_MAIN_NS}t'
+# 工作表中的行、公式和内联字符串
+_ROW = f'{_MAIN_NS}row'
+_FORMULA = f'{_MAIN_NS}f'
+_INLINE_STRING = f'{_MAIN_NS}is'
+
+# 直接改写 XML 时使用：只替换 <t> 文本节点的内容，去除标签以检查未替换的占位符，
+# 读取 XML 声明中的编码，以及转义属性引号
+_XML_TEXT_NODE = re.compile(r'(<t(?:\s[^>]*)?>)([^<]*)(</t>)')
+_XML_TAG = re.compile(r'<[^>]*>')
+_XML_ENCODING = re.compile(rb'<\?xml[^>]*encoding=["\']([\w.-]+)["\']')
+_XML_QUOTE = {'"': '&quot;'}
+
+_PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+
+def _string_item_text(elem: ET.Element) -> str:
+    """
+    共享字符串条目 <si> 或内联字符串 <is> 的文本
+    
+    富文本字符串由多个 <r><t> 组成，拼接后再匹配；忽略 <rPh> 注音。
+    """
+    plain = elem.find(_SI_TEXT)
+    if plain is not None:
+        return plain.text or ''
+    return ''.join(t.text or '' for t in elem.iterfind(_SI_RUN_TEXT))
+
+
+@functools.lru_cache(maxsize=4096)
+def _extract_keys(text: str) -> Tuple[str, ...]:
+    """
+    提取文本中的占位符名称（按文本缓存，模板中大量重复的单元格文本只匹配一次）
+    
+    Args:
+        text: 单元格文本
+        
+    Returns:
+        占位符名称元组
+    """
+    return tuple(_PLACEHOLDER_PATTERN.findall(text))
 
 
 class ExcelParser:
     """XLSX 模板解析器"""
     
-    PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+    PLACEHOLDER_PATTERN = _PLACEHOLDER_PATTERN
+    # 可能包含占位符的单元格类型：字符串、公式、内联字符串
+    TEXT_TYPES = frozenset(('s', 'f', 'inlineStr'))
+    SHARED_STRINGS_PART = 'xl/sharedStrings.xml'
+    # 可编辑工作簿的加载选项：跳过 VBA 与外部链接的读取和回写；data_only=False 保留公式
+    EDIT_OPTIONS = {'keep_vba': False, 'keep_links': False, 'data_only': False}
+    # 逐单元格扫描时并行处理工作表的最大线程数
+    MAX_SCAN_WORKERS = 8
     
     def __init__(self, template_path: str):
         """
@@ -24,58 +86,273 @@ class ExcelParser:
             template_path: Excel 模板文件路径
         """
         self.template_path = template_path
-        self.workbook = load_workbook(template_path)
+        # 可编辑工作簿只在无法直接改写 XML 时才加载
+        self._workbook: Optional[Workbook] = None
+        # 尚未应用到工作簿的填充（保存时直接改写 XML）
+        self._pending_fills: List[Dict[str, str]] = []
+    
+    @property
+    def workbook(self) -> Workbook:
+        """
+        可编辑工作簿（延迟加载）
+        
+        find_placeholders 不使用该工作簿，在等待 LLM 生成期间不会常驻内存。
+        """
+        if self._workbook is None:
+            self._workbook = load_workbook(self.template_path, **self.EDIT_OPTIONS)
+            for content_map in self._pending_fills:
+                self._fill_workbook(self._workbook, content_map)
+            self._pending_fills = []
+        return self._workbook
     
     def find_placeholders(self) -> List[str]:
         """
         查找模板中所有的占位符
         
+        有共享字符串表时流式扫描该表，并流式扫描各工作表中的公式和内联字符串；
+        没有共享字符串表时逐个单元格扫描。
+        
         Returns:
             占位符名称列表（不包含双花括号）
         """
+        placeholders = self._scan_shared_strings()
+        if placeholders is None:
+            placeholders = self._scan_cells()
+        else:
+            placeholders |= self._scan_sheet_parts()
+        
+        return list(placeholders)
+    
+    def _scan_shared_strings(self) -> Optional[Set[str]]:
+        """
+        流式解析 xl/sharedStrings.xml 查找占位符
+        
+        Returns:
+            占位符集合，工作簿没有共享字符串表时返回 None
+        """
         placeholders = set()
         
-        for sheet in self.workbook.worksheets:
-            for row in sheet.iter_rows():
-                for cell in row:
-                    if cell.value and isinstance(cell.value, str):
-                        matches = self.PLACEHOLDER_PATTERN.findall(cell.value)
-                        placeholders.update(matches)
+        with zipfile.ZipFile(self.template_path) as archive:
+            try:
+                source = archive.open(self.SHARED_STRINGS_PART)
+            except KeyError:
+                return None
+            
+            with source:
+                for _, elem in ET.iterparse(source, events=('end',)):
+                    if elem.tag != _SI:
+                        continue
+                    text = _string_item_text(elem)
+                    # 共享字符串表中的条目互不重复，无需经过 _extract_keys 缓存
+                    if '{{' in text:
+                        placeholders.update(self.PLACEHOLDER_PATTERN.findall(text))
+                    elem.clear()
         
-        return list(placeholders)
+        return placeholders
+    
+    def _scan_sheet_parts(self) -> Set[str]:
+        """流式解析各工作表 XML，查找公式（<f>）与内联字符串（<is>）中的占位符"""
+        placeholders = set()
+        
+        with zipfile.ZipFile(self.template_path) as archive:
+            for info in archive.infolist():
+                if not self._is_sheet_part(info.filename):
+                    continue
+                with archive.open(info) as source:
+                    for _, elem in ET.iterparse(source, events=('end',)):
+                        tag = elem.tag
+                        if tag == _FORMULA:
+                            text = elem.text or ''
+                        elif tag == _INLINE_STRING:
+                            text = _string_item_text(elem)
+                        else:
+                            if tag == _ROW:
+                                elem.clear()
+                            continue
+                        if '{{' in text:
+                            placeholders.update(_extract_keys(text))
+        
+        return placeholders
+    
+    def _scan_cells(self) -> Set[str]:
+        """使用只读模式临时打开工作簿，并行扫描各工作表的单元格值（公式按公式文本扫描）"""
+        placeholders = set()
+        
+        workbook = load_workbook(
+            self.template_path, read_only=True, data_only=False, keep_links=False
+        )
+        try:
+            sheets = workbook.worksheets
+            if len(sheets) > 1:
+                # 各工作表相互独立，分别解析各自的 XML
+                with ThreadPoolExecutor(max_workers=min(self.MAX_SCAN_WORKERS, len(sheets))) as executor:
+                    for found in executor.map(self._scan_sheet, sheets):
+                        placeholders |= found
+            else:
+                for sheet in sheets:
+                    placeholders |= self._scan_sheet(sheet)
+        finally:
+            workbook.close()
+        
+        return placeholders
+    
+    def _scan_sheet(self, sheet) -> Set[str]:
+        """查找单个工作表中的占位符"""
+        placeholders = set()
+        for row in sheet.iter_rows(values_only=True):
+            for value in row:
+                if isinstance(value, str):
+                    placeholders.update(_extract_keys(value))
+        return placeholders
     
     def fill_placeholders(self, content_map: Dict[str, str]) -> None:
         """
         填充占位符，保留原有格式
         
+        未加载可编辑工作簿时只记录填充内容，保存时直接改写 XML 中的文本。
+        
         Args:
             content_map: 占位符名称 -> 填充内容 的映射
         """
-        for sheet in self.workbook.worksheets:
+        if self._workbook is None:
+            self._pending_fills.append(dict(content_map))
+        else:
+            self._fill_workbook(self._workbook, content_map)
+    
+    def _fill_workbook(self, workbook: Workbook, content_map: Dict[str, str]) -> None:
+        """逐个单元格填充可编辑工作簿"""
+        sub = self.PLACEHOLDER_PATTERN.sub
+        
+        def replace(match):
+            return content_map.get(match.group(1), match.group(0))
+        
+        for sheet in workbook.worksheets:
             for row in sheet.iter_rows():
                 for cell in row:
-                    if cell.value and isinstance(cell.value, str):
-                        new_value = cell.value
-                        for placeholder, content in content_map.items():
-                            pattern = f'{{{{{placeholder}}}}}'
-                            if pattern in new_value:
-                                new_value = new_value.replace(pattern, content)
-                        if new_value != cell.value:
-                            # 保留单元格的原有格式
-                            cell.value = new_value
+                    # 数值、日期、布尔等单元格不可能包含占位符
+                    if cell.data_type not in self.TEXT_TYPES:
+                        continue
+                    value = cell.value
+                    # 绝大多数单元格不含占位符，先做一次子串查找再走正则缓存
+                    if not isinstance(value, str) or '{{' not in value:
+                        continue
+                    if not _extract_keys(value):
+                        continue
+                    new_value = sub(replace, value)
+                    if new_value != value:
+                        # 保留单元格的原有格式
+                        cell.value = new_value
     
     def save(self, output_path: str) -> None:
         """
         保存填充后的文档
         
+        只有文本替换时直接流式改写 XLSX 包内的共享字符串表和工作表 XML，
+        其余部件原样复制；无法安全改写时回退为 openpyxl 完整序列化。
+        
         Args:
             output_path: 输出文件路径
         """
+        if self._workbook is None and self._save_text_only(output_path):
+            return
         self.workbook.save(output_path)
     
+    def _save_text_only(self, output_path: str) -> bool:
+        """
+        直接改写 XML 文本保存
+        
+        Returns:
+            是否已保存；返回 False 时未写入任何内容
+        """
+        for content_map in self._pending_fills:
+            for content in content_map.values():
+                # 非法 XML 字符、首尾空白（需要 xml:space="preserve"）交给 openpyxl 处理
+                if ILLEGAL_CHARACTERS_RE.search(content) or content != content.strip():
+                    return False
+        
+        with zipfile.ZipFile(self.template_path) as source:
+            rewritten = {}
+            for info in source.infolist():
+                if not self._is_text_part(info.filename):
+                    continue
+                xml = self._decode_part(source.read(info))
+                if xml is None:
+                    return False
+                if '{{' not in xml:
+                    continue
+                new_xml = self._rewrite_xml(xml)
+                if new_xml is None:
+                    return False
+                rewritten[info.filename] = new_xml.encode('utf-8')
+            
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as target:
+                for info in source.infolist():
+                    if info.filename in rewritten:
+                        target.writestr(info, rewritten[info.filename])
+                    else:
+                        with source.open(info) as src, target.open(info, 'w') as dst:
+                            shutil.copyfileobj(src, dst, 1024 * 1024)
+        
+        return True
+    
+    def _is_text_part(self, name: str) -> bool:
+        """是否为可能包含单元格文本的部件"""
+        return name == self.SHARED_STRINGS_PART or self._is_sheet_part(name)
+    
+    def _is_sheet_part(self, name: str) -> bool:
+        """是否为工作表部件"""
+        return name.startswith('xl/worksheets/') and name.endswith('.xml')
+    
+    def _decode_part(self, data: bytes) -> Optional[str]:
+        """
+        解码 XML 部件
+        
+        Returns:
+            XML 文本；部件不是 UTF-8 编码时返回 None（交给 openpyxl 处理）
+        """
+        declaration = _XML_ENCODING.match(data.lstrip(b'\xef\xbb\xbf'))
+        if declaration is not None and declaration.group(1).lower() not in (b'utf-8', b'utf8'):
+            return None
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    
+    def _rewrite_xml(self, xml: str) -> Optional[str]:
+        """
+        依次应用记录的填充内容
+        
+        只替换共享字符串和内联字符串的 <t> 文本节点，公式、页眉页脚等其他内容保持不变。
+        
+        Returns:
+            改写后的 XML；待填充的占位符位于公式中或被拆分到多个富文本片段等
+            无法直接替换时返回 None
+        """
+        for content_map in self._pending_fills:
+            def replace(match):
+                content = content_map.get(match.group(1))
+                return match.group(0) if content is None else escape(content, _XML_QUOTE)
+            
+            def replace_text(node):
+                text = node.group(2)
+                if '{{' not in text:
+                    return node.group(0)
+                return node.group(1) + self.PLACEHOLDER_PATTERN.sub(replace, text) + node.group(3)
+            
+            xml = _XML_TEXT_NODE.sub(replace_text, xml)
+            
+            # 去掉标签后仍能拼出待填充的占位符：它位于 <t> 之外（如公式）或跨越了多个文本节点
+            for key in self.PLACEHOLDER_PATTERN.findall(_XML_TAG.sub('', xml)):
+                if key in content_map:
+                    return None
+        return xml
+    
     def close(self) -> None:
         """关闭工作簿"""
-        self.workbook.close()
+        self._pending_fills = []
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
 
 
 if __name__ == '__main__':
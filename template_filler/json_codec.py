@@ -0,0 +1,47 @@
+"""
+JSON 编解码
+
+优先使用 orjson（C 实现，直接输出 UTF-8 bytes），未安装时回退到标准库 json。
+"""
+
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+    import json
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    序列化为 UTF-8 编码的 JSON
+    
+    Args:
+        obj: 待序列化对象
+        indent: 是否缩进（仅用于需要人工查看的文件）
+    
+    Returns:
+        JSON bytes（非 ASCII 字符不转义）
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    反序列化 JSON
+    
+    Raises:
+        ValueError: JSON 格式错误
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
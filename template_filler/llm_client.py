@@ -6,15 +6,83 @@ LLMClient: LLM API 封装
 
 import os
 import time
-from typing import Optional, List
-from openai import OpenAI
+import asyncio
+import threading
+from typing import Optional, List, Tuple, Dict, Awaitable, TypeVar
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 
 from .cache_manager import CacheManager
 
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# 并发生成时复用连接，避免每个请求重新握手
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# 同步 HTTP 连接池在所有 LLMClient 实例间共享（服务端每个请求都会新建 LLMClient）
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def _shared_http_client() -> httpx.Client:
+    """获取共享的同步 HTTP 客户端"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = DefaultHttpxClient(http2=_HTTP2, limits=_HTTP_LIMITS)
+    return _http_client
+
+
+# 异步连接池绑定事件循环：每个事件循环一个，同一循环内的所有 LLMClient 共享
+_async_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+T = TypeVar('T')
+
+
+def _shared_async_http_client(loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+    """获取事件循环对应的共享异步 HTTP 客户端"""
+    with _http_client_lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            # 丢弃已结束事件循环遗留的条目
+            for stale in [l for l in _async_http_clients if l.is_closed()]:
+                del _async_http_clients[stale]
+            client = _async_http_clients[loop] = DefaultAsyncHttpxClient(http2=_HTTP2, limits=_HTTP_LIMITS)
+        return client
+
+
+async def aclose_http_client() -> None:
+    """关闭当前事件循环的共享异步 HTTP 客户端（应用关闭或 asyncio.run 结束前调用）"""
+    loop = asyncio.get_running_loop()
+    with _http_client_lock:
+        client = _async_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+async def run_and_close(coro: Awaitable[T]) -> T:
+    """
+    执行协程，结束后关闭当前事件循环的共享异步 HTTP 客户端
+    
+    供 asyncio.run 包装使用：事件循环随 asyncio.run 结束，其连接池也一并释放。
+    """
+    try:
+        return await coro
+    finally:
+        await aclose_http_client()
+
 
 class LLMClient:
     """LLM API 客户端"""
     
+    # 单次调用内并发请求的上限（遵守服务商的速率限制）
+    MAX_CONCURRENCY = 8
+    
     def __init__(
         self,
         api_key: Optional[str] = None,
@@ -48,9 +116,14 @@ class LLMClient:
         
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            http_client=_shared_http_client()
         )
         
+        # 异步客户端绑定事件循环，按当前事件循环延迟创建，连接池在同一循环内共享
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_http: Optional[httpx.AsyncClient] = None
+        
         # 初始化缓存
         self.cache = CacheManager(enabled=cache_enabled, ttl_hours=cache_ttl_hours)
     
@@ -75,20 +148,20 @@ class LLMClient:
         Returns:
             生成的文本
         """
-        # 尝试从缓存获取
-        if use_cache:
-            cached = self.cache.get(prompt, self.model, system_prompt or "")
+        # 缓存键只计算一次，查询和写入共用
+        cache_key = self.cache.make_key(prompt, self.model, system_prompt or "") if use_cache else None
+        if cache_key:
+            cached = self.cache.get_by_key(cache_key)
             if cached:
                 return cached
         
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_prompt)
+        create = self.client.chat.completions.create
+        max_retries = self.max_retries
         
-        for attempt in range(self.max_retries):
+        for attempt in range(max_retries):
             try:
-                response = self.client.chat.completions.create(
+                response = create(
                     model=self.model,
                     messages=messages,
                     temperature=temperature,
@@ -97,16 +170,135 @@ class LLMClient:
                 result = response.choices[0].message.content.strip()
                 
                 # 存入缓存
-                if use_cache:
-                    self.cache.set(prompt, result, self.model, system_prompt or "")
+                if cache_key:
+                    self.cache.set_by_key(cache_key, prompt, result, self.model)
                 
                 return result
             except Exception as e:
-                if attempt < self.max_retries - 1:
-                    print(f"LLM API error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    print(f"LLM API error (attempt {attempt + 1}/{max_retries}): {e}")
                     time.sleep(self.retry_delay * (attempt + 1))
                 else:
-                    raise RuntimeError(f"LLM API failed after {self.max_retries} attempts: {e}")
+                    raise RuntimeError(f"LLM API failed after {max_retries} attempts: {e}")
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """当前事件循环使用的异步客户端"""
+        loop = asyncio.get_running_loop()
+        http_client = _shared_async_http_client(loop)
+        if self._async_client is None or self._async_http is not http_client:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client
+            )
+            self._async_http = http_client
+        return self._async_client
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        use_cache: bool = True
+    ) -> str:
+        """
+        生成文本（异步版本，参数同 generate）
+        
+        Returns:
+            生成的文本
+        """
+        # 缓存键只计算一次，查询和写入共用
+        cache_key = self.cache.make_key(prompt, self.model, system_prompt or "") if use_cache else None
+        if cache_key:
+            # 缓存读写涉及磁盘 I/O，放到线程池中执行以免阻塞事件循环
+            cached = await asyncio.to_thread(self.cache.get_by_key, cache_key)
+            if cached:
+                return cached
+        
+        messages = self._build_messages(prompt, system_prompt)
+        create = self.async_client.chat.completions.create
+        max_retries = self.max_retries
+        
+        for attempt in range(max_retries):
+            try:
+                response = await create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                result = response.choices[0].message.content.strip()
+                
+                if cache_key:
+                    await asyncio.to_thread(self.cache.set_by_key, cache_key, prompt, result, self.model)
+                
+                return result
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    print(f"LLM API error (attempt {attempt + 1}/{max_retries}): {e}")
+                    await asyncio.sleep(self.retry_delay * (attempt + 1))
+                else:
+                    raise RuntimeError(f"LLM API failed after {max_retries} attempts: {e}")
+    
+    async def agenerate_multiple(
+        self,
+        prompt: str,
+        count: int = 3,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.9,
+        max_tokens: int = 1000
+    ) -> List[str]:
+        """
+        生成多个候选文本（异步版本，参数同 generate_multiple）
+        
+        Returns:
+            生成的文本列表
+        """
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(prompt, system_prompt),
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=count
+            )
+            results = [choice.message.content.strip() for choice in response.choices]
+            if len(results) >= count:
+                return results[:count]
+        except Exception as e:
+            print(f"LLM API n={count} request failed, falling back to separate requests: {e}")
+        
+        # 不支持 n 参数的服务：逐个并发请求，并发数不超过 MAX_CONCURRENCY
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        
+        async def generate_one(i: int) -> str:
+            async with semaphore:
+                return await self.agenerate(
+                    prompt=f"{prompt}\n\n请提供第 {i + 1} 种不同的表达方式。",
+                    system_prompt=system_prompt,
+                    temperature=min(temperature + i * 0.05, 1.0),
+                    max_tokens=max_tokens,
+                    use_cache=False
+                )
+        
+        return list(await asyncio.gather(*(generate_one(i) for i in range(count))))
+    
+    def get_cached(self, requests: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+        """
+        批量查询缓存（不调用 API）
+        
+        Args:
+            requests: (用户 prompt, 系统 prompt) 列表
+            
+        Returns:
+            与 requests 一一对应的缓存结果，未命中的为 None
+        """
+        return self.cache.get_many(
+            [(prompt, system_prompt or "") for prompt, system_prompt in requests],
+            self.model
+        )
     
     def generate_multiple(
         self,
@@ -129,6 +321,22 @@ class LLMClient:
         Returns:
             生成的文本列表
         """
+        # 一次请求返回 count 个候选，prompt 只计费一次
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(prompt, system_prompt),
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=count
+            )
+            results = [choice.message.content.strip() for choice in response.choices]
+            if len(results) >= count:
+                return results[:count]
+        except Exception as e:
+            print(f"LLM API n={count} request failed, falling back to separate requests: {e}")
+        
+        # 不支持 n 参数的服务（忽略参数或报错）：逐个请求
         results = []
         for i in range(count):
             # 稍微调整温度以获得不同结果
@@ -144,6 +352,15 @@ class LLMClient:
             results.append(result)
         return results
     
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: Optional[str]) -> List[dict]:
+        """构建对话消息列表"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
     def get_cache_stats(self):
         """获取缓存统计信息"""
         return self.cache.get_stats()
@@ -5,12 +5,19 @@ Orchestrator: 流程协调器
 """
 
 import yaml
-from typing import Dict, Any, Optional, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, Any, Optional, List, Awaitable
 
-from .template_parser import TemplateParser
+from .template_parser import TemplateParser, fill_template
 from .prompt_engine import PromptEngine
-from .llm_client import LLMClient
+from .llm_client import LLMClient, run_and_close
+
+# 优先使用 libyaml 的 C 实现解析 Schema
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 
 class Orchestrator:
@@ -22,7 +29,8 @@ class Orchestrator:
         context: str,
         schema: Dict[str, Any],
         llm_client: Optional[LLMClient] = None,
-        max_workers: int = 5
+        max_workers: int = 5,
+        executor: Optional[Executor] = None
     ):
         """
         初始化协调器
@@ -32,15 +40,18 @@ class Orchestrator:
             context: 原始材料文本
             schema: Schema 配置
             llm_client: LLM 客户端实例，如果为 None 则创建默认客户端
-            max_workers: 并发 worker 数量
+            max_workers: 最大并发请求数
+            executor: 执行填充和保存的执行器（如进程池），为 None 时使用默认线程池
         """
         self.template_path = template_path
         self.context = context
         self.schema = schema
         self.max_workers = max_workers
+        self.executor = executor
         
         self.template_parser = TemplateParser(template_path)
         self.prompt_engine = PromptEngine(context, schema)
+        self._schema_names = frozenset(self.prompt_engine.get_placeholder_names())
         self.llm_client = llm_client or LLMClient()
     
     @classmethod
@@ -67,7 +78,7 @@ class Orchestrator:
             context = f.read()
         
         with open(schema_path, 'r', encoding='utf-8') as f:
-            schema = yaml.safe_load(f)
+            schema = yaml.load(f, Loader=SafeLoader)
         
         return cls(template_path, context, schema, llm_client)
     
@@ -79,15 +90,23 @@ class Orchestrator:
             output_path: 输出文件路径
             selections: select 模式下的选择（占位符 -> 选项索引），如果为 None 则使用第一个选项
             
+        Returns:
+            执行结果，包含生成的内容和元信息
+        """
+        return asyncio.run(run_and_close(self.run_async(output_path, selections)))
+    
+    async def run_async(self, output_path: str, selections: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        执行模板填充流程（异步版本，参数同 run）
+        
         Returns:
             执行结果，包含生成的内容和元信息
         """
         # 1. 获取模板中的占位符
-        template_placeholders = self.template_parser.find_placeholders()
-        schema_placeholders = self.prompt_engine.get_placeholder_names()
+        template_placeholders = await asyncio.to_thread(self.template_parser.find_placeholders)
         
-        # 合并占位符列表（模板中的 + Schema 中定义的）
-        all_placeholders = list(set(template_placeholders) & set(schema_placeholders))
+        # 合并占位符列表（模板中的 + Schema 中定义的），保持模板中的顺序
+        all_placeholders = [p for p in template_placeholders if p in self._schema_names]
         
         if not all_placeholders:
             print("Warning: No matching placeholders found between template and schema")
@@ -97,46 +116,62 @@ class Orchestrator:
         results = {}
         generated_options = {}  # 存储 select 模式的所有选项
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
-            for placeholder in all_placeholders:
-                mode = self.prompt_engine.get_mode(placeholder)
-                prompt = self.prompt_engine.build_prompt(placeholder)
-                system_prompt = self.prompt_engine.get_system_prompt()
-                
+        system_prompt = self.prompt_engine.get_system_prompt()
+        jobs = []
+        for placeholder in all_placeholders:
+            mode = self.prompt_engine.get_mode(placeholder)
+            prompt = self.prompt_engine.build_prompt(placeholder)
+            jobs.append((placeholder, mode, prompt, system_prompt))
+        
+        # 单个生成的占位符先批量查询缓存，命中的不再发起请求
+        cached = await self._lookup_cached([job for job in jobs if job[1] != 'select'])
+        results.update(cached)
+        
+        # prompt、系统 prompt、模式和数量都相同的占位符只请求一次
+        semaphore = asyncio.Semaphore(self.max_workers)
+        tasks = {}
+        placeholder_keys = {}
+        for placeholder, mode, prompt, system_prompt in jobs:
+            if placeholder in cached:
+                continue
+            
+            count = self.prompt_engine.get_options_count(placeholder) if mode == 'select' else 1
+            key = (prompt, system_prompt, mode, count)
+            placeholder_keys[placeholder] = (mode, key)
+            if key in tasks:
+                continue
+            
+            if mode == 'select':
+                coro = self.llm_client.agenerate_multiple(prompt, count, system_prompt)
+            else:
+                coro = self.llm_client.agenerate(prompt, system_prompt)
+            tasks[key] = asyncio.create_task(self._bounded(semaphore, coro))
+        
+        outcomes = dict(zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)))
+        for placeholder, (mode, key) in placeholder_keys.items():
+            content = outcomes[key]
+            try:
+                if isinstance(content, BaseException):
+                    raise content
                 if mode == 'select':
-                    count = self.prompt_engine.get_options_count(placeholder)
-                    future = executor.submit(
-                        self._generate_multiple,
-                        placeholder, prompt, system_prompt, count
-                    )
+                    generated_options[placeholder] = content
+                    # 使用选择或默认第一个
+                    selected_idx = (selections or {}).get(placeholder, 0)
+                    results[placeholder] = content[selected_idx]
                 else:
-                    future = executor.submit(
-                        self._generate_single,
-                        placeholder, prompt, system_prompt
-                    )
-                futures[future] = (placeholder, mode)
-            
-            for future in as_completed(futures):
-                placeholder, mode = futures[future]
-                try:
-                    content = future.result()
-                    if mode == 'select':
-                        generated_options[placeholder] = content
-                        # 使用选择或默认第一个
-                        selected_idx = (selections or {}).get(placeholder, 0)
-                        results[placeholder] = content[selected_idx]
-                    else:
-                        results[placeholder] = content
-                except Exception as e:
-                    print(f"Error generating content for {placeholder}: {e}")
-                    results[placeholder] = f"[生成失败: {placeholder}]"
-        
-        # 3. 填充模板
-        self.template_parser.fill_placeholders(results)
+                    results[placeholder] = content
+            except Exception as e:
+                print(f"Error generating content for {placeholder}: {e}")
+                results[placeholder] = f"[生成失败: {placeholder}]"
         
-        # 4. 保存文件
-        self.template_parser.save(output_path)
+        # 3. 填充模板并保存文件
+        if self.executor is not None:
+            # 进程池中重新打开模板填充，CPU 密集的 XML 处理不受 GIL 限制
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, fill_template, self.template_path, results, output_path
+            )
+        else:
+            await asyncio.to_thread(self._fill_and_save, results, output_path)
         
         return {
             'output_path': output_path,
@@ -151,69 +186,111 @@ class Orchestrator:
         Returns:
             预览结果，包含所有生成的内容和选项
         """
-        template_placeholders = self.template_parser.find_placeholders()
-        schema_placeholders = self.prompt_engine.get_placeholder_names()
-        all_placeholders = list(set(template_placeholders) & set(schema_placeholders))
+        return asyncio.run(run_and_close(self.preview_async()))
+    
+    async def preview_async(self) -> Dict[str, Any]:
+        """
+        预览生成结果（异步版本）
+        
+        Returns:
+            预览结果，包含所有生成的内容和选项
+        """
+        template_placeholders = await asyncio.to_thread(self.template_parser.find_placeholders)
+        all_placeholders = [p for p in template_placeholders if p in self._schema_names]
         
         results = {}
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
-            for placeholder in all_placeholders:
-                mode = self.prompt_engine.get_mode(placeholder)
-                count = self.prompt_engine.get_options_count(placeholder)
-                
-                # 手动模式直接使用配置的值，不调用 LLM
-                if mode == 'manual':
-                    manual_value = self.prompt_engine.get_manual_value(placeholder)
-                    results[placeholder] = {
-                        'mode': 'manual',
-                        'content': [manual_value],
-                        'selected': 0
-                    }
-                    continue
-                
-                prompt = self.prompt_engine.build_prompt(placeholder)
-                system_prompt = self.prompt_engine.get_system_prompt()
-                
-                # 使用 options_count 判断是否生成多个
-                if count > 1:
-                    future = executor.submit(
-                        self._generate_multiple,
-                        placeholder, prompt, system_prompt, count
-                    )
-                else:
-                    future = executor.submit(
-                        self._generate_single,
-                        placeholder, prompt, system_prompt
-                    )
-                futures[future] = (placeholder, mode, count)
+        system_prompt = self.prompt_engine.get_system_prompt()
+        jobs = []
+        for placeholder in all_placeholders:
+            mode = self.prompt_engine.get_mode(placeholder)
+            count = self.prompt_engine.get_options_count(placeholder)
             
-            for future in as_completed(futures):
-                placeholder, mode, count = futures[future]
-                try:
-                    content = future.result()
-                    results[placeholder] = {
-                        'mode': mode,
-                        'content': content if count > 1 else [content],
-                        'selected': 0
-                    }
-                except Exception as e:
-                    results[placeholder] = {
-                        'mode': mode,
-                        'content': [f"[生成失败: {e}]"],
-                        'selected': 0
-                    }
+            # 手动模式直接使用配置的值，不调用 LLM
+            if mode == 'manual':
+                manual_value = self.prompt_engine.get_manual_value(placeholder)
+                results[placeholder] = {
+                    'mode': 'manual',
+                    'content': [manual_value],
+                    'selected': 0
+                }
+                continue
+            
+            prompt = self.prompt_engine.build_prompt(placeholder)
+            jobs.append((placeholder, mode, prompt, system_prompt, count))
+        
+        cached = await self._lookup_cached([job[:4] for job in jobs if job[4] <= 1])
+        for placeholder, content in cached.items():
+            results[placeholder] = {
+                'mode': self.prompt_engine.get_mode(placeholder),
+                'content': [content],
+                'selected': 0
+            }
+        
+        semaphore = asyncio.Semaphore(self.max_workers)
+        tasks = {}
+        placeholder_keys = {}
+        for placeholder, mode, prompt, system_prompt, count in jobs:
+            if placeholder in cached:
+                continue
+            
+            key = (prompt, system_prompt, mode, count)
+            placeholder_keys[placeholder] = (mode, count, key)
+            if key in tasks:
+                continue
+            
+            # 使用 options_count 判断是否生成多个
+            if count > 1:
+                coro = self.llm_client.agenerate_multiple(prompt, count, system_prompt)
+            else:
+                coro = self.llm_client.agenerate(prompt, system_prompt)
+            tasks[key] = asyncio.create_task(self._bounded(semaphore, coro))
+        
+        outcomes = dict(zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)))
+        for placeholder, (mode, count, key) in placeholder_keys.items():
+            content = outcomes[key]
+            if isinstance(content, BaseException):
+                results[placeholder] = {
+                    'mode': mode,
+                    'content': [f"[生成失败: {content}]"],
+                    'selected': 0
+                }
+            else:
+                results[placeholder] = {
+                    'mode': mode,
+                    'content': content if count > 1 else [content],
+                    'selected': 0
+                }
         
         return {'placeholders': results}
     
-    def _generate_single(self, placeholder: str, prompt: str, system_prompt: str) -> str:
-        """生成单个内容"""
-        return self.llm_client.generate(prompt, system_prompt)
+    async def _bounded(self, semaphore: asyncio.Semaphore, coro: Awaitable[Any]) -> Any:
+        """在并发上限内执行单个生成请求"""
+        async with semaphore:
+            return await coro
     
-    def _generate_multiple(self, placeholder: str, prompt: str, system_prompt: str, count: int) -> List[str]:
-        """生成多个候选内容"""
-        return self.llm_client.generate_multiple(prompt, count, system_prompt)
+    def _fill_and_save(self, results: Dict[str, str], output_path: str) -> None:
+        """填充模板并保存"""
+        self.template_parser.fill_placeholders(results)
+        self.template_parser.save(output_path)
+    
+    async def _lookup_cached(self, jobs: List[tuple]) -> Dict[str, str]:
+        """
+        一次性批量查询单个生成任务的缓存（读盘放到线程池中执行，不阻塞事件循环）
+        
+        Args:
+            jobs: (占位符, 模式, prompt, 系统 prompt) 列表
+            
+        Returns:
+            命中缓存的 占位符 -> 内容
+        """
+        if not jobs:
+            return {}
+        contents = await asyncio.to_thread(
+            self.llm_client.get_cached,
+            [(prompt, system_prompt) for _, _, prompt, system_prompt in jobs]
+        )
+        return {job[0]: content for job, content in zip(jobs, contents) if content}
 
 
 if __name__ == '__main__':
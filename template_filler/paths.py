@@ -0,0 +1,28 @@
+"""
+本地存储路径
+
+数据根目录在导入时解析一次：优先使用环境变量 TEMPLATE_FILLER_HOME，默认为 ~/.template_filler。
+"""
+
+import os
+from pathlib import Path
+
+
+BASE_DIR = Path(os.environ.get('TEMPLATE_FILLER_HOME') or os.path.expanduser('~/.template_filler'))
+
+
+def ensure_dir(path: Path) -> Path:
+    """
+    确保目录存在
+    
+    目录已存在时只需一次 stat，不再发起 mkdir 系统调用。
+    
+    Args:
+        path: 目录路径
+    
+    Returns:
+        传入的路径
+    """
+    if not path.is_dir():
+        path.mkdir(parents=True, exist_ok=True)
+    return path
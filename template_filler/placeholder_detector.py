@@ -38,6 +38,10 @@ class PlaceholderDetector:
         '名称': '从内容中提取名称',
     }
     
+    # 部分匹配的快速预检：名称包含任一常见键，或为任一常见键的子串
+    _PARTIAL_PATTERN = re.compile('|'.join(sorted(map(re.escape, COMMON_PROMPTS), key=len, reverse=True)))
+    _JOINED_KEYS = '\0'.join(COMMON_PROMPTS)
+    
     # 需要 select 模式的占位符
     SELECT_MODE_PLACEHOLDERS = {'TITLE', '标题', 'SUMMARY', '摘要', 'ABSTRACT'}
     
@@ -109,7 +113,11 @@ class PlaceholderDetector:
         if placeholder_name in self.COMMON_PROMPTS:
             return self.COMMON_PROMPTS[placeholder_name]
         
-        # 部分匹配
+        # 部分匹配：大多数名称与常见键无关，先用一次正则和一次子串查找排除
+        if not self._PARTIAL_PATTERN.search(name_upper) and name_upper not in self._JOINED_KEYS:
+            return f'根据内容生成 {placeholder_name} 的内容'
+        
+        # 命中时按字典顺序取第一个匹配的键，与逐个比较的结果一致
         for key, prompt in self.COMMON_PROMPTS.items():
             if key in name_upper or name_upper in key:
                 return prompt
@@ -2,6 +2,9 @@
 PromptEngine: Prompt 构建引擎
 
 将 Context（原始材料）与 Schema 中的 Prompt 组合，生成发送给 LLM 的完整 Prompt。
+
+消息顺序固定为 系统 Prompt -> 原始材料 -> 占位符任务，同一会话内各占位符的
+前缀逐字节相同，可以命中服务端的前缀缓存。
 """
 
 from typing import Dict, Any, Optional
@@ -17,6 +20,8 @@ class PromptEngine:
 3. 语言应当正式、专业
 4. 不要添加任何额外的解释或说明，只输出要求的内容本身"""
     
+    PROMPT_SUFFIX = "\n\n请直接输出结果，不要添加任何解释或前缀。"
+    
     def __init__(self, context: str, schema: Dict[str, Any]):
         """
         初始化 Prompt 引擎
@@ -28,6 +33,8 @@ class PromptEngine:
         self.context = context
         self.schema = schema
         self.placeholders = schema.get('placeholders', {})
+        # 各占位符共用的原始材料部分只拼接一次
+        self._context_block = f"## 原始材料\n\n{context}\n\n## 任务\n\n"
     
     def build_prompt(self, placeholder_name: str) -> str:
         """
@@ -45,26 +52,20 @@ class PromptEngine:
         placeholder_config = self.placeholders[placeholder_name]
         slot_prompt = placeholder_config.get('prompt', f'生成 {placeholder_name} 的内容')
         
-        full_prompt = f"""## 原始材料
-
-{self.context}
-
-## 任务
-
-{slot_prompt}
-
-请直接输出结果，不要添加任何解释或前缀。"""
-        
-        return full_prompt
+        # 占位符相关的内容只能出现在共享前缀之后
+        prompt = self._context_block + slot_prompt + self.PROMPT_SUFFIX
+        # 构建时断言前缀未漂移：同一会话的所有 Prompt 都以相同的原始材料块开头
+        assert prompt.startswith(self._context_block), f"prompt prefix drifted for {placeholder_name}"
+        return prompt
     
     def get_system_prompt(self) -> str:
         """
         获取系统 Prompt
         
         Returns:
-            系统 Prompt 字符串
+            系统 Prompt 字符串，Schema 未配置（或为空）时使用默认值
         """
-        return self.schema.get('system_prompt', self.DEFAULT_SYSTEM_PROMPT)
+        return self.schema.get('system_prompt') or self.DEFAULT_SYSTEM_PROMPT
     
     def get_mode(self, placeholder_name: str) -> str:
         """
@@ -7,7 +7,12 @@ Web Server: FastAPI 后端
 import os
 import uuid
 import shutil
+import time
+import asyncio
 import tempfile
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Dict, Any, List
 from pathlib import Path
 
@@ -15,9 +20,9 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import yaml
@@ -26,10 +31,13 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from template_filler.orchestrator import Orchestrator
-from template_filler.llm_client import LLMClient
+from template_filler.llm_client import LLMClient, aclose_http_client
+from template_filler.cache_manager import CacheManager
 from template_filler.docx_to_html import DocxToHtml
 from template_filler.placeholder_detector import PlaceholderDetector
 from template_filler.config_store import config_store
+from template_filler.session_store import SessionStore
+from template_filler import json_codec
 
 
 # 创建临时目录存储上传的文件
@@ -39,10 +47,98 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR = Path(tempfile.gettempdir()) / "template_filler_outputs"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# 上传模板大小上限（默认 50MB），按块流式写入磁盘
+MAX_UPLOAD_SIZE = int(os.getenv("TEMPLATE_FILLER_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ZIP_MAGIC = b"PK\x03\x04"
+
+# 生成文档时填充模板的进程数
+FILL_PROCESSES = int(os.getenv("TEMPLATE_FILLER_FILL_PROCESSES", "0")) or os.cpu_count() or 1
+
+# 临时文件清理间隔：每次删除超过会话有效期、且不属于任何现存会话的文件
+GC_INTERVAL = int(os.getenv("TEMPLATE_FILLER_GC_INTERVAL_MINUTES", "15")) * 60
+
+
+def _remove_stale_files(keep: set, max_age: float) -> int:
+    """
+    删除上传目录和输出目录中过期的临时文件
+    
+    Args:
+        keep: 需要保留的文件路径（现存会话仍在使用）
+        max_age: 文件最长保留时间（秒）
+    
+    Returns:
+        删除的文件数量
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for directory in (UPLOAD_DIR, OUTPUT_DIR):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.path in keep or not entry.is_file():
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+async def _gc_loop() -> None:
+    """后台清理循环：淘汰过期会话并删除遗留的临时文件"""
+    while True:
+        await asyncio.sleep(GC_INTERVAL)
+        try:
+            # 会话只在事件循环中访问，淘汰和收集路径在这里完成，文件删除放到线程池
+            sessions.evict_expired()
+            keep = sessions.file_paths()
+            await asyncio.to_thread(_remove_stale_files, keep, sessions.ttl_hours * 3600)
+        except OSError as e:
+            print(f"Temp file cleanup failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台清理任务和文档填充进程池，关闭时释放"""
+    gc_task = asyncio.create_task(_gc_loop())
+    # spawn 启动的子进程不继承事件循环线程持有的锁
+    app.state.fill_pool = ProcessPoolExecutor(
+        max_workers=FILL_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    # 统计接口共用的缓存实例，与各请求中 LLMClient() 使用的默认缓存设置一致
+    app.state.llm_cache = CacheManager()
+    try:
+        yield
+    finally:
+        gc_task.cancel()
+        try:
+            await gc_task
+        except asyncio.CancelledError:
+            pass
+        app.state.fill_pool.shutdown(cancel_futures=True)
+        await aclose_http_client()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    使用 json_codec（orjson）序列化的 JSON 响应
+    
+    返回大块 HTML 的接口直接构造该响应，跳过 FastAPI 对返回值的 jsonable_encoder 遍历。
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
+
+
 app = FastAPI(
     title="Template Filler",
     description="使用 LLM 自动填充文档模板",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS 配置
@@ -54,8 +150,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 存储会话数据
-sessions: Dict[str, Dict[str, Any]] = {}
+# 存储会话数据：闲置超过有效期（默认 24 小时）的会话连同其文件一起淘汰
+sessions = SessionStore(
+    ttl_hours=float(os.getenv("TEMPLATE_FILLER_SESSION_TTL_HOURS", "24")),
+    max_sessions=int(os.getenv("TEMPLATE_FILLER_MAX_SESSIONS", "1000"))
+)
 
 
 class SchemaInput(BaseModel):
@@ -75,18 +174,50 @@ class GenerateRequest(BaseModel):
     selections: Dict[str, int] = {}
 
 
+def _save_upload(source, file_path: Path) -> None:
+    """
+    将上传文件按块复制到磁盘
+    
+    Raises:
+        ValueError: 文件超过 MAX_UPLOAD_SIZE
+    """
+    written = 0
+    try:
+        with open(file_path, "wb") as f:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_UPLOAD_SIZE:
+                    raise ValueError("upload too large")
+                f.write(chunk)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+
+
 @app.post("/api/upload-template")
-async def upload_template(file: UploadFile = File(...)):
+async def upload_template(
+    file: UploadFile = File(...),
+    content_length: Optional[int] = Header(None)
+):
     """上传模板文件"""
     if not file.filename.endswith('.docx'):
         raise HTTPException(400, "只支持 .docx 文件")
+    # Content-Length 包含 multipart 边界，只用于提前拒绝明显超限的请求
+    if content_length is not None and content_length > MAX_UPLOAD_SIZE + UPLOAD_CHUNK_SIZE:
+        raise HTTPException(413, f"文件不能超过 {MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
+    
+    # .docx 是 ZIP 包，按文件头拒绝仅改了扩展名的其他文件
+    if await file.read(len(ZIP_MAGIC)) != ZIP_MAGIC:
+        raise HTTPException(400, "文件不是有效的 .docx 文档")
+    await file.seek(0)
     
     session_id = str(uuid.uuid4())
     file_path = UPLOAD_DIR / f"{session_id}_template.docx"
     
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    try:
+        await asyncio.to_thread(_save_upload, file.file, file_path)
+    except ValueError:
+        raise HTTPException(413, f"文件不能超过 {MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
     
     sessions[session_id] = {
         "template_path": str(file_path),
@@ -132,21 +263,24 @@ async def preview(request: PreviewRequest):
     if "schema" not in session:
         raise HTTPException(400, "请先配置 Schema")
     
-    try:
-        llm_client = LLMClient()
-        orchestrator = Orchestrator(
-            template_path=session["template_path"],
-            context=session["context"],
-            schema=session["schema"],
-            llm_client=llm_client
-        )
-        
-        result = orchestrator.preview()
-        sessions[session_id]["preview"] = result
-        
-        return result
-    except Exception as e:
-        raise HTTPException(500, f"预览生成失败: {str(e)}")
+    with sessions.pin(session_id):
+        try:
+            llm_client = LLMClient()
+            # 构造时会解析模板，放到线程池中执行以免阻塞事件循环
+            orchestrator = await asyncio.to_thread(
+                Orchestrator,
+                template_path=session["template_path"],
+                context=session["context"],
+                schema=session["schema"],
+                llm_client=llm_client
+            )
+            
+            result = await orchestrator.preview_async()
+            session["preview"] = result
+            
+            return FastJSONResponse(result)
+        except Exception as e:
+            raise HTTPException(500, f"预览生成失败: {str(e)}")
 
 
 class RegenerateRequest(BaseModel):
@@ -175,57 +309,60 @@ async def regenerate_placeholder(request: RegenerateRequest):
     if placeholder not in schema.get("placeholders", {}):
         raise HTTPException(400, f"占位符 {placeholder} 不存在")
     
-    try:
-        llm_client = LLMClient()
-        
-        # 获取该占位符的配置
-        placeholder_config = schema["placeholders"][placeholder]
-        
-        # 确保 placeholder_config 是字典
-        if isinstance(placeholder_config, str):
-            placeholder_config = {"prompt": placeholder_config, "mode": "llm"}
-        
-        mode = placeholder_config.get("mode", "llm")
-        prompt = placeholder_config.get("prompt", f"根据内容生成 {placeholder}")
-        options_count = placeholder_config.get("options_count", 1)
-        
-        if mode == "manual":
-            # 手动模式直接返回配置的值
-            content = [placeholder_config.get("manualValue", "")]
-        else:
-            # LLM 生成
-            from template_filler.prompt_engine import PromptEngine
+    with sessions.pin(session_id):
+        try:
+            llm_client = LLMClient()
             
-            # 构建单独的 schema
-            single_schema = {
-                "placeholders": {placeholder: placeholder_config}
-            }
+            # 获取该占位符的配置
+            placeholder_config = schema["placeholders"][placeholder]
             
-            engine = PromptEngine(single_schema, session["context"])
-            full_prompt = engine.build_prompt(placeholder)
+            # 确保 placeholder_config 是字典
+            if isinstance(placeholder_config, str):
+                placeholder_config = {"prompt": placeholder_config, "mode": "llm"}
             
-            # llm 模式根据 options_count 生成
-            if options_count > 1:
-                content = llm_client.generate_multiple(full_prompt, n=options_count)
+            mode = placeholder_config.get("mode", "llm")
+            prompt = placeholder_config.get("prompt", f"根据内容生成 {placeholder}")
+            options_count = placeholder_config.get("options_count", 1)
+            
+            if mode == "manual":
+                # 手动模式直接返回配置的值
+                content = [placeholder_config.get("manualValue", "")]
             else:
-                content = [llm_client.generate(full_prompt)]
-        
-        # 更新 preview 结果
-        if "preview" in session and "placeholders" in session["preview"]:
-            session["preview"]["placeholders"][placeholder] = {
+                # LLM 生成
+                from template_filler.prompt_engine import PromptEngine
+                
+                # 构建单独的 schema，沿用会话的系统 Prompt，保证与预览时的前缀一致
+                single_schema = {
+                    "placeholders": {placeholder: placeholder_config},
+                    "system_prompt": schema.get("system_prompt")
+                }
+                
+                engine = PromptEngine(session["context"], single_schema)
+                full_prompt = engine.build_prompt(placeholder)
+                system_prompt = engine.get_system_prompt()
+                
+                # llm 模式根据 options_count 生成，多个候选并发请求
+                if options_count > 1:
+                    content = await llm_client.agenerate_multiple(full_prompt, options_count, system_prompt)
+                else:
+                    content = [await llm_client.agenerate(full_prompt, system_prompt)]
+            
+            # 更新 preview 结果
+            if "preview" in session and "placeholders" in session["preview"]:
+                session["preview"]["placeholders"][placeholder] = {
+                    "mode": mode,
+                    "content": content,
+                    "selected": 0
+                }
+            
+            return {
+                "placeholder": placeholder,
                 "mode": mode,
                 "content": content,
                 "selected": 0
             }
-        
-        return {
-            "placeholder": placeholder,
-            "mode": mode,
-            "content": content,
-            "selected": 0
-        }
-    except Exception as e:
-        raise HTTPException(500, f"重新生成失败: {str(e)}")
+        except Exception as e:
+            raise HTTPException(500, f"重新生成失败: {str(e)}")
 
 
 @app.post("/api/generate")
@@ -244,33 +381,43 @@ async def generate(request: GenerateRequest):
     if "schema" not in session:
         raise HTTPException(400, "请先配置 Schema")
     
-    try:
-        output_filename = f"{session_id}_output.docx"
-        output_path = OUTPUT_DIR / output_filename
-        
-        llm_client = LLMClient()
-        orchestrator = Orchestrator(
-            template_path=session["template_path"],
-            context=session["context"],
-            schema=session["schema"],
-            llm_client=llm_client
-        )
-        
-        result = orchestrator.run(str(output_path), request.selections)
-        sessions[session_id]["output_path"] = str(output_path)
-        
-        return {
-            "success": True,
-            "download_url": f"/api/download/{session_id}",
-            "filled_placeholders": result["filled_placeholders"]
-        }
-    except Exception as e:
-        raise HTTPException(500, f"文档生成失败: {str(e)}")
+    with sessions.pin(session_id):
+        try:
+            output_filename = f"{session_id}_output.docx"
+            output_path = OUTPUT_DIR / output_filename
+            
+            llm_client = LLMClient()
+            # 构造时会解析模板，放到线程池中执行以免阻塞事件循环
+            orchestrator = await asyncio.to_thread(
+                Orchestrator,
+                template_path=session["template_path"],
+                context=session["context"],
+                schema=session["schema"],
+                llm_client=llm_client,
+                # 未经 lifespan 启动（如测试客户端）时没有进程池，回退到线程池
+                executor=getattr(app.state, "fill_pool", None)
+            )
+            
+            result = await orchestrator.run_async(str(output_path), request.selections)
+            session["output_path"] = str(output_path)
+            
+            return {
+                "success": True,
+                "download_url": f"/api/download/{session_id}",
+                "filled_placeholders": result["filled_placeholders"]
+            }
+        except Exception as e:
+            raise HTTPException(500, f"文档生成失败: {str(e)}")
+
+
+def _file_etag(st: os.stat_result) -> str:
+    """由 inode、修改时间和大小生成 ETag，重新生成文档后随之变化"""
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
 
 
 @app.get("/api/download/{session_id}")
-async def download(session_id: str):
-    """下载生成的文档"""
+async def download(session_id: str, if_none_match: Optional[str] = Header(None)):
+    """下载生成的文档（支持 If-None-Match 条件请求）"""
     if session_id not in sessions:
         raise HTTPException(404, "Session not found")
     
@@ -279,16 +426,25 @@ async def download(session_id: str):
         raise HTTPException(400, "请先生成文档")
     
     output_path = session["output_path"]
-    if not os.path.exists(output_path):
+    try:
+        st = os.stat(output_path)
+    except FileNotFoundError:
         raise HTTPException(404, "文件不存在")
     
+    # 同一会话会重新生成并覆盖输出文件，浏览器每次都需要重新验证
+    headers = {"ETag": _file_etag(st), "Cache-Control": "private, no-cache"}
+    if if_none_match and headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    
     original_name = session.get("template_name", "output.docx")
     download_name = f"filled_{original_name}"
     
     return FileResponse(
         output_path,
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        filename=download_name
+        filename=download_name,
+        headers=headers,
+        stat_result=st
     )
 
 
@@ -297,11 +453,9 @@ async def delete_session(session_id: str):
     """删除会话及相关文件"""
     if session_id in sessions:
         session = sessions[session_id]
-        # 清理文件
-        for key in ["template_path", "output_path"]:
-            if key in session and os.path.exists(session[key]):
-                os.remove(session[key])
         del sessions[session_id]
+        # 清理文件，放到线程中执行以免阻塞事件循环
+        await asyncio.to_thread(sessions.remove_files, session)
     return {"success": True}
 
 
@@ -315,25 +469,26 @@ async def parse_template(session_id: str):
     if "template_path" not in session:
         raise HTTPException(400, "请先上传模板")
     
-    try:
-        converter = DocxToHtml(session["template_path"])
-        result = converter.convert_with_highlight()
-        
-        # 使用 PlaceholderDetector 生成建议的 Schema
-        detector = PlaceholderDetector()
-        suggested_schema = detector._generate_schema(result['placeholders'])
-        
-        sessions[session_id]["template_html"] = result['raw_html']
-        sessions[session_id]["detected_placeholders"] = result['placeholders']
-        
-        return {
-            "html": result['html'],
-            "placeholders": result['placeholders'],
-            "suggested_schema": suggested_schema,
-            "messages": result['messages']
-        }
-    except Exception as e:
-        raise HTTPException(500, f"模板解析失败: {str(e)}")
+    with sessions.pin(session_id):
+        try:
+            converter = DocxToHtml(session["template_path"])
+            result = await asyncio.to_thread(converter.convert_with_highlight)
+            
+            # 使用 PlaceholderDetector 生成建议的 Schema
+            detector = PlaceholderDetector()
+            suggested_schema = detector._generate_schema(result['placeholders'])
+            
+            session["template_html"] = result['raw_html']
+            session["detected_placeholders"] = result['placeholders']
+            
+            return FastJSONResponse({
+                "html": result['html'],
+                "placeholders": result['placeholders'],
+                "suggested_schema": suggested_schema,
+                "messages": result['messages']
+            })
+        except Exception as e:
+            raise HTTPException(500, f"模板解析失败: {str(e)}")
 
 
 class PreviewFilledRequest(BaseModel):
@@ -342,6 +497,13 @@ class PreviewFilledRequest(BaseModel):
     content_map: Dict[str, str]
 
 
+def _fill_template_html(template_path: str, content_map: Dict[str, str]) -> str:
+    """转换模板并填充内容，返回 HTML"""
+    converter = DocxToHtml(template_path)
+    converter.convert()
+    return converter.fill_html(content_map)
+
+
 @app.post("/api/preview-filled")
 async def preview_filled(request: PreviewFilledRequest):
     """预览填充后的 HTML"""
@@ -353,14 +515,15 @@ async def preview_filled(request: PreviewFilledRequest):
     if "template_html" not in session:
         raise HTTPException(400, "请先解析模板")
     
-    try:
-        converter = DocxToHtml(session["template_path"])
-        converter.convert()
-        filled_html = converter.fill_html(request.content_map)
-        
-        return {"html": filled_html}
-    except Exception as e:
-        raise HTTPException(500, f"预览生成失败: {str(e)}")
+    with sessions.pin(session_id):
+        try:
+            filled_html = await asyncio.to_thread(
+                _fill_template_html, session["template_path"], request.content_map
+            )
+            
+            return FastJSONResponse({"html": filled_html})
+        except Exception as e:
+            raise HTTPException(500, f"预览生成失败: {str(e)}")
 
 
 # ========== Config APIs ==========
@@ -467,6 +630,14 @@ if static_dir.exists():
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
 
+@app.get("/api/stats")
+async def get_stats():
+    """LLM 响应缓存统计（条目数、大小、本进程内的命中 / 未命中次数）"""
+    # 未经 lifespan 启动（如测试客户端）时没有共享实例，临时创建
+    cache = getattr(app.state, "llm_cache", None) or CacheManager()
+    return {"llm_cache": await asyncio.to_thread(cache.get_stats)}
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     """返回 Web UI 主页"""
@@ -486,4 +657,19 @@ async def index():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    # 安装 uvicorn[standard] 后，loop / http 的 "auto" 会自动选用 uvloop 和 httptools
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    if workers > 1:
+        # 会话保存在各进程内存中，多进程部署需要负载均衡按会话保持粘性
+        print(f"Warning: running {workers} workers, sessions are not shared between workers")
+    
+    uvicorn.run(
+        "template_filler.server:app" if workers > 1 else app,
+        host=os.getenv("UVICORN_HOST", "0.0.0.0"),
+        port=int(os.getenv("UVICORN_PORT", "8000")),
+        workers=workers,
+        loop="auto",
+        http="auto",
+        access_log=os.getenv("UVICORN_ACCESS_LOG", "1") != "0"
+    )
@@ -0,0 +1,151 @@
+"""
+SessionStore: Web 会话存储
+
+按最近访问时间排序保存会话，闲置超过有效期或数量超过上限的会话会被淘汰，
+并删除其上传的模板和生成的文档，进程内存占用有上限。
+仍有请求在处理中的会话（pin）不会被淘汰。
+"""
+
+import os
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+
+def _remove_paths(paths: List[str]) -> None:
+    """删除文件，已被其他清理任务删除的文件直接跳过"""
+    for path in paths:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+class SessionStore:
+    """带闲置过期的会话存储，接口与 dict 一致"""
+    
+    # 会话关联的磁盘文件，淘汰会话时一并删除
+    FILE_KEYS = ('template_path', 'output_path')
+    
+    def __init__(self, ttl_hours: float = 24, max_sessions: int = 1000):
+        """
+        初始化会话存储
+        
+        Args:
+            ttl_hours: 会话闲置有效期（小时）
+            max_sessions: 最多保留的会话数量
+        """
+        self.ttl_hours = ttl_hours
+        self._ttl_seconds = ttl_hours * 3600
+        self.max_sessions = max_sessions
+        # session_id -> (最近访问时间, 会话数据)，最久未访问的在前
+        self._sessions: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # session_id -> 处理中的请求数，计数大于 0 的会话不淘汰
+        self._in_use: Dict[str, int] = {}
+    
+    @contextlib.contextmanager
+    def pin(self, session_id: str) -> Iterator[None]:
+        """
+        标记会话有请求正在处理（如等待 LLM 生成），期间不会被淘汰
+        
+        Args:
+            session_id: 会话 ID
+        """
+        self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+        try:
+            yield
+        finally:
+            count = self._in_use.pop(session_id) - 1
+            if count:
+                self._in_use[session_id] = count
+    
+    def _evict(self) -> None:
+        """淘汰过期会话及超出数量上限的最久未访问会话（跳过处理中的会话）"""
+        cutoff = time.monotonic() - self._ttl_seconds
+        sessions = self._sessions
+        excess = len(sessions) - self.max_sessions
+        victims = []
+        for session_id, (accessed_at, _) in sessions.items():
+            # 按访问时间排序，之后的会话都未过期
+            if accessed_at >= cutoff and excess <= 0:
+                break
+            if self._in_use.get(session_id):
+                continue
+            victims.append(session_id)
+            excess -= 1
+        
+        for session_id in victims:
+            _, session = sessions.pop(session_id)
+            self._remove_files(session)
+    
+    def evict_expired(self) -> None:
+        """立即淘汰过期会话（供后台清理任务定期调用）"""
+        self._evict()
+    
+    def file_paths(self) -> Set[str]:
+        """
+        Returns:
+            现存会话关联的全部文件路径
+        """
+        self._evict()
+        return {
+            session[key]
+            for _, session in self._sessions.values()
+            for key in self.FILE_KEYS
+            if session.get(key)
+        }
+    
+    def remove_files(self, session: Dict[str, Any]) -> None:
+        """删除会话关联的文件（同步执行，已不存在的文件跳过）"""
+        _remove_paths(self._file_paths_of(session))
+    
+    def _file_paths_of(self, session: Dict[str, Any]) -> List[str]:
+        """会话关联的文件路径"""
+        return [session[key] for key in self.FILE_KEYS if session.get(key)]
+    
+    def _remove_files(self, session: Dict[str, Any]) -> None:
+        """删除被淘汰会话的文件（在事件循环中调用时放到线程池执行）"""
+        paths = self._file_paths_of(session)
+        if not paths:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _remove_paths(paths)
+        else:
+            loop.run_in_executor(None, _remove_paths, paths)
+    
+    def __contains__(self, session_id: str) -> bool:
+        self._evict()
+        return session_id in self._sessions
+    
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        self._evict()
+        _, session = self._sessions[session_id]
+        # 每次访问都刷新闲置计时
+        self._sessions[session_id] = (time.monotonic(), session)
+        self._sessions.move_to_end(session_id)
+        return session
+    
+    def __setitem__(self, session_id: str, session: Dict[str, Any]) -> None:
+        self._sessions[session_id] = (time.monotonic(), session)
+        self._sessions.move_to_end(session_id)
+        self._evict()
+    
+    def __delitem__(self, session_id: str) -> None:
+        del self._sessions[session_id]
+    
+    def __len__(self) -> int:
+        self._evict()
+        return len(self._sessions)
+    
+    def __iter__(self) -> Iterator[str]:
+        self._evict()
+        return iter(list(self._sessions))
+    
+    def get(self, session_id: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """获取会话，不存在时返回 default"""
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
@@ -2,16 +2,27 @@
 TemplateManager: 模板库管理系统
 
 管理模板文件和对应的 Schema 配置。
+
+Schema 以 JSON 保存（schema.json）；早期版本写入的 schema.yaml 仍可读取，
+并在下次 update_schema 时迁移为 JSON。
 """
 
 import os
-import json
 import shutil
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import yaml
 
+# 旧版 YAML Schema 优先使用 libyaml 的 C 实现读取
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from . import json_codec
+from .paths import BASE_DIR, ensure_dir
+
 
 class TemplateManager:
     """模板库管理器"""
@@ -21,29 +32,45 @@ class TemplateManager:
         初始化模板管理器
         
         Args:
-            storage_dir: 存储目录，默认为 ~/.template_filler/templates
+            storage_dir: 存储目录，默认为 $TEMPLATE_FILLER_HOME/templates（~/.template_filler/templates）
         """
         if storage_dir:
             self.storage_dir = Path(storage_dir)
         else:
-            self.storage_dir = Path.home() / ".template_filler" / "templates"
+            self.storage_dir = BASE_DIR / "templates"
         
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        ensure_dir(self.storage_dir)
         self.index_file = self.storage_dir / "index.json"
         self._load_index()
     
     def _load_index(self):
         """加载模板索引"""
         if self.index_file.exists():
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                self.index = json.load(f)
+            self.index = json_codec.loads(self.index_file.read_bytes())
         else:
             self.index = {"templates": {}}
     
     def _save_index(self):
         """保存模板索引"""
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        self.index_file.write_bytes(json_codec.dumps(self.index, indent=True))
+    
+    def _write_schema(self, template_dir: Path, schema: Dict[str, Any]) -> Path:
+        """
+        以 JSON 格式保存 Schema
+        
+        Returns:
+            Schema 文件路径
+        """
+        schema_path = template_dir / "schema.json"
+        schema_path.write_bytes(json_codec.dumps(schema, indent=True))
+        return schema_path
+    
+    def _read_schema(self, schema_path: Path) -> Dict[str, Any]:
+        """读取 Schema，兼容旧版的 YAML 文件"""
+        data = schema_path.read_bytes()
+        if data.lstrip()[:1] in (b'{', b'['):
+            return json_codec.loads(data)
+        return yaml.load(data, Loader=SafeLoader)
     
     def add_template(
         self,
@@ -70,16 +97,15 @@ class TemplateManager:
         template_dir = self.storage_dir / template_id
         template_dir.mkdir(exist_ok=True)
         
-        # 复制模板文件
+        # 复制模板文件：库内文件只按内容使用，不保留元数据，copyfile 在 Linux 上走 sendfile；
+        # 不用硬链接，以免用户之后在原处编辑源文件时改动库内模板
         src_path = Path(template_path)
         ext = src_path.suffix
         dest_path = template_dir / f"template{ext}"
-        shutil.copy2(template_path, dest_path)
+        shutil.copyfile(template_path, dest_path)
         
         # 保存 Schema
-        schema_path = template_dir / "schema.yaml"
-        with open(schema_path, 'w', encoding='utf-8') as f:
-            yaml.dump(schema, f, allow_unicode=True, default_flow_style=False)
+        schema_path = self._write_schema(template_dir, schema)
         
         # 更新索引
         self.index["templates"][template_id] = {
@@ -114,8 +140,7 @@ class TemplateManager:
         schema_path = self.storage_dir / info["schema"]
         
         # 加载 Schema
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            schema = yaml.safe_load(f)
+        schema = self._read_schema(schema_path)
         
         return {
             "id": template_id,
@@ -168,10 +193,13 @@ class TemplateManager:
             return False
         
         info = self.index["templates"][template_id]
-        schema_path = self.storage_dir / info["schema"]
+        old_schema_path = self.storage_dir / info["schema"]
         
-        with open(schema_path, 'w', encoding='utf-8') as f:
-            yaml.dump(schema, f, allow_unicode=True, default_flow_style=False)
+        schema_path = self._write_schema(old_schema_path.parent, schema)
+        if schema_path != old_schema_path:
+            # 旧版 YAML Schema 迁移为 JSON
+            old_schema_path.unlink(missing_ok=True)
+            info["schema"] = str(schema_path.relative_to(self.storage_dir))
         
         info["updated_at"] = datetime.now().isoformat()
         self._save_index()
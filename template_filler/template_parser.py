@@ -4,9 +4,69 @@ TemplateParser: DOCX 模板解析与填充
 解析 Word 文档中的 {{KEYWORD}} 占位符，并在保留格式的情况下替换内容。
 """
 
+import os
 import re
+import copy
+import zipfile
+import threading
+import functools
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from docx import Document
-from typing import Dict, List, Tuple
+from docx.document import Document as DocumentObject
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from typing import Dict, List, Optional, Pattern, Tuple
+
+
+# 解析后的原始模板缓存：(inode, mtime_ns, size) -> Document，命中时深拷贝而不重新解压、解析 XML
+_DOCUMENT_CACHE: Dict[Tuple[int, int, int], DocumentObject] = {}
+_DOCUMENT_CACHE_SIZE = 16
+# 缓存模板的文件总大小上限；解析后的 XML 树比压缩包大数倍，上传模板最大可达 50MB，
+# 只按条数限制时缓存可能占用大量内存。超过上限的单个模板不缓存
+_DOCUMENT_CACHE_BYTES = 32 * 1024 * 1024
+_DOCUMENT_CACHE_LOCK = threading.Lock()
+
+_W_P = qn('w:p')
+_W_T = qn('w:t')
+
+# 主文档部件（找不到时回退为完整解析）
+_DOCUMENT_PART = 'word/document.xml'
+
+
+def _load_document(template_path: str) -> DocumentObject:
+    """
+    加载模板文档，同一文件未变化时复用已解析的结果
+    
+    Args:
+        template_path: Word 模板文件路径
+        
+    Returns:
+        可独立修改的 Document 副本
+    """
+    st = os.stat(template_path)
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _DOCUMENT_CACHE_LOCK:
+        pristine = _DOCUMENT_CACHE.get(key)
+    
+    if pristine is None:
+        pristine = Document(template_path)
+        if st.st_size <= _DOCUMENT_CACHE_BYTES:
+            with _DOCUMENT_CACHE_LOCK:
+                _DOCUMENT_CACHE.pop(key, None)
+                # 按插入顺序淘汰，直到条数和文件总大小（键中的 size）都在上限内
+                total = st.st_size + sum(cached[2] for cached in _DOCUMENT_CACHE)
+                while _DOCUMENT_CACHE and (
+                    len(_DOCUMENT_CACHE) >= _DOCUMENT_CACHE_SIZE or total > _DOCUMENT_CACHE_BYTES
+                ):
+                    oldest = next(iter(_DOCUMENT_CACHE))
+                    del _DOCUMENT_CACHE[oldest]
+                    total -= oldest[2]
+                _DOCUMENT_CACHE[key] = pristine
+    
+    # 缓存中的文档只读，填充在副本上进行
+    return copy.deepcopy(pristine)
 
 
 class TemplateParser:
@@ -22,128 +82,156 @@ class TemplateParser:
             template_path: Word 模板文件路径
         """
         self.template_path = template_path
-        self.document = Document(template_path)
+    
+    @functools.cached_property
+    def document(self) -> DocumentObject:
+        """
+        可编辑文档（首次访问时加载）
+        
+        只查找占位符时不需要完整解析，find_placeholders 直接流式读取文档 XML。
+        """
+        return _load_document(self.template_path)
+    
+    def _paragraph_elements(self) -> List:
+        """
+        正文中所有段落的 <w:p> 元素
+        
+        一次遍历 XML 树即可覆盖正文段落、表格（含嵌套表格、合并单元格）中的段落，
+        不再经由 paragraphs / tables / rows / cells 逐层创建代理对象。
+        """
+        return list(self.document.element.body.iter(_W_P))
     
     def find_placeholders(self) -> List[str]:
         """
         查找模板中所有的占位符
         
         Returns:
-            占位符名称列表（不包含双花括号）
+            按首次出现顺序排列的占位符名称列表（不包含双花括号）
         """
-        placeholders = set()
+        if 'document' not in self.__dict__:
+            placeholders = self._scan_document_xml()
+            if placeholders is not None:
+                return placeholders
         
-        # 遍历所有段落
-        for paragraph in self.document.paragraphs:
-            text = paragraph.text
-            matches = self.PLACEHOLDER_PATTERN.findall(text)
-            placeholders.update(matches)
+        # 用 dict 去重以保留占位符首次出现的顺序
+        placeholders: Dict[str, None] = {}
+        findall = self.PLACEHOLDER_PATTERN.findall
         
-        # 遍历所有表格
-        for table in self.document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        text = paragraph.text
-                        matches = self.PLACEHOLDER_PATTERN.findall(text)
-                        placeholders.update(matches)
+        for p in self._paragraph_elements():
+            # 同一段落内的文本节点拼接后再匹配，兼容跨 run 的占位符
+            text = ''.join(t.text or '' for t in p.iter(_W_T))
+            if '{{' in text:
+                placeholders.update(dict.fromkeys(findall(text)))
         
         return list(placeholders)
     
-    def fill_placeholders(self, content_map: Dict[str, str]) -> None:
+    def _scan_document_xml(self) -> Optional[List[str]]:
         """
-        填充占位符，保留原有格式
+        不加载 Document，直接流式解析 word/document.xml 查找占位符
         
-        Args:
-            content_map: 占位符名称 -> 填充内容 的映射
+        Returns:
+            按首次出现顺序排列的占位符列表，文档包中没有 word/document.xml 时返回 None
         """
-        # 处理段落
-        for paragraph in self.document.paragraphs:
-            self._replace_in_paragraph(paragraph, content_map)
+        placeholders: Dict[str, None] = {}
+        findall = self.PLACEHOLDER_PATTERN.findall
+        
+        with zipfile.ZipFile(self.template_path) as archive:
+            try:
+                source = archive.open(_DOCUMENT_PART)
+            except KeyError:
+                return None
+            
+            with source:
+                for _, elem in ET.iterparse(source, events=('end',)):
+                    if elem.tag != _W_P:
+                        continue
+                    text = ''.join(t.text or '' for t in elem.iter(_W_T))
+                    if '{{' in text:
+                        placeholders.update(dict.fromkeys(findall(text)))
+                    elem.clear()
         
-        # 处理表格
-        for table in self.document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        self._replace_in_paragraph(paragraph, content_map)
+        return list(placeholders)
     
-    def _replace_in_paragraph(self, paragraph, content_map: Dict[str, str]) -> None:
+    def fill_placeholders(self, content_map: Dict[str, str]) -> None:
         """
-        在段落中替换占位符，保留格式
+        填充占位符，保留原有格式
         
-        策略：在 run 级别进行替换，以保留字体、颜色等格式
+        Args:
+            content_map: 占位符名称 -> 填充内容 的映射
         """
-        # 获取段落的完整文本
-        full_text = paragraph.text
-        
-        # 检查是否包含占位符
-        if not self.PLACEHOLDER_PATTERN.search(full_text):
+        if not content_map:
             return
         
-        # 对于每个占位符，查找并替换
-        for placeholder, content in content_map.items():
-            pattern = f'{{{{{placeholder}}}}}'
-            if pattern in full_text:
-                # 遍历 runs 查找包含占位符的 run
-                self._replace_in_runs(paragraph.runs, pattern, content)
+        # 本次填充的占位符编译为一个交替正则，只匹配 content_map 中的名称
+        pattern = re.compile(r'\{\{(' + '|'.join(map(re.escape, content_map)) + r')\}\}')
+        
+        for p in self._paragraph_elements():
+            # 先在原始文本节点上判断，不含占位符的段落不创建 Paragraph / Run 代理对象
+            if '{{' not in ''.join(t.text or '' for t in p.iter(_W_T)):
+                continue
+            self._replace_in_paragraph(Paragraph(p, self.document), content_map, pattern)
     
-    def _replace_in_runs(self, runs, pattern: str, content: str) -> None:
+    def _replace_in_paragraph(
+        self,
+        paragraph,
+        content_map: Dict[str, str],
+        pattern: Optional[Pattern[str]] = None
+    ) -> None:
         """
-        在 runs 中替换占位符
+        在段落中替换占位符，保留格式
+        
+        策略：在 run 级别进行替换，以保留字体、颜色等格式。
+        一次正则扫描找出段落中所有待填充的占位符，只改写被占位符触及的 run；
+        跨多个 run 的占位符（如 "{{" 在一个 run，"NAME}}" 在另一个 run）的
+        替换内容放入占位符起始处所在的 run，其余 run 中的占位符字符被移除。
         
-        处理跨 run 的占位符情况（如 "{{" 在一个 run，"NAME}}" 在另一个 run）
+        Args:
+            paragraph: 段落
+            content_map: 占位符名称 -> 填充内容 的映射
+            pattern: 只匹配待填充占位符的正则，默认使用 PLACEHOLDER_PATTERN
         """
-        # 简单情况：占位符完全在一个 run 内
-        for run in runs:
-            if pattern in run.text:
-                run.text = run.text.replace(pattern, content)
-                return
+        runs = paragraph.runs
+        texts = [run.text for run in runs]
+        combined = ''.join(texts)
         
-        # 复杂情况：占位符跨多个 runs
-        # 合并所有 run 的文本，找到占位符位置，然后重建
-        combined_text = ''.join(run.text for run in runs)
-        if pattern not in combined_text:
+        # 只有 run 中的文本可以替换，直接在合并后的 run 文本上检查
+        if '{{' not in combined:
             return
         
-        # 计算每个 run 的字符范围
-        run_ranges = []
-        pos = 0
-        for run in runs:
-            run_ranges.append((pos, pos + len(run.text), run))
-            pos += len(run.text)
-        
-        # 找到占位符的位置
-        start_idx = combined_text.find(pattern)
-        end_idx = start_idx + len(pattern)
+        # 各 run 在合并文本中的结束位置（单调不减），用二分查找定位占位符所在的 run
+        ends = list(accumulate(map(len, texts)))
+        # run 序号 -> [(run 内删除起点, 删除终点, 插入内容)]，只有被占位符触及的 run 需要改写
+        edits: Dict[int, List[Tuple[int, int, str]]] = {}
         
-        # 找到涉及的 runs
-        affected_runs = []
-        for start, end, run in run_ranges:
-            if start < end_idx and end > start_idx:
-                affected_runs.append((start, end, run))
+        for match in (pattern or self.PLACEHOLDER_PATTERN).finditer(combined):
+            content = content_map.get(match.group(1))
+            if content is None:
+                continue
+            start, end = match.span()
+            # 起点所在的 run（结束位置大于 start 的第一个 run）到终点所在的 run
+            first = bisect_right(ends, start)
+            last = bisect_left(ends, end, first)
+            for k in range(first, last + 1):
+                # 跳过中间的空 run（可能只含图片等非文本内容，改写 text 会将其清空）
+                if not texts[k]:
+                    continue
+                run_start = ends[k] - len(texts[k])
+                edits.setdefault(k, []).append((
+                    max(start, run_start) - run_start,
+                    min(end, ends[k]) - run_start,
+                    content if k == first else ''
+                ))
         
-        if not affected_runs:
-            return
-        
-        # 在第一个受影响的 run 中放置替换内容，清空其他受影响的 runs
-        first_run = affected_runs[0][2]
-        first_start = affected_runs[0][0]
-        
-        # 计算需要保留的前缀和后缀
-        prefix = combined_text[:start_idx]
-        suffix = combined_text[end_idx:]
-        new_text = prefix + content + suffix
-        
-        # 重建 runs
-        char_pos = 0
-        for start, end, run in run_ranges:
-            run_len = end - start
-            if char_pos + run_len <= len(new_text):
-                run.text = new_text[char_pos:char_pos + run_len]
-            else:
-                run.text = new_text[char_pos:] if char_pos < len(new_text) else ''
-            char_pos += run_len
+        for k, run_edits in edits.items():
+            text = texts[k]
+            parts = []
+            pos = 0
+            for cut_start, cut_end, insert in run_edits:
+                parts.append(text[pos:cut_start])
+                parts.append(insert)
+                pos = cut_end
+            parts.append(text[pos:])
+            runs[k].text = ''.join(parts)
     
     def save(self, output_path: str) -> None:
         """
@@ -155,6 +243,20 @@ class TemplateParser:
         self.document.save(output_path)
 
 
+def fill_template(template_path: str, content_map: Dict[str, str], output_path: str) -> None:
+    """
+    填充模板并保存（模块级函数，可提交到进程池执行）
+    
+    Args:
+        template_path: Word 模板文件路径
+        content_map: 占位符名称 -> 填充内容 的映射
+        output_path: 输出文件路径
+    """
+    parser = TemplateParser(template_path)
+    parser.fill_placeholders(content_map)
+    parser.save(output_path)
+
+
 if __name__ == '__main__':
     # 简单测试
     import sys
@@ -0,0 +1,112 @@
+"""
+测试公共 fixture
+"""
+
+import io
+import os
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from template_filler import cache_manager
+from template_filler.server import app
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'test_template.docx')
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# 导入时检查一次，不在每个测试中重复 stat
+TEMPLATE_MISSING = not os.path.exists(TEMPLATE_PATH)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "requires_template: 需要测试模板文件 test_template.docx")
+
+
+def pytest_collection_modifyitems(config, items):
+    """测试模板不存在时，在收集阶段统一跳过标记了 requires_template 的测试"""
+    if not TEMPLATE_MISSING:
+        return
+    skip = pytest.mark.skip(reason="测试模板文件不存在")
+    for item in items:
+        if 'requires_template' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def test_template_path():
+    """测试模板路径（整个测试会话共用）"""
+    return TEMPLATE_PATH
+
+
+@pytest.fixture(scope="module")
+def data_home(tmp_path_factory):
+    """
+    临时数据根目录（每个测试模块一个）
+    
+    BASE_DIR 在导入时解析，除环境变量 TEMPLATE_FILLER_HOME 外还需替换已导入模块中的值，
+    以免 lifespan 创建的缓存等写入真实的 ~/.template_filler。
+    """
+    home = tmp_path_factory.mktemp('home')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('TEMPLATE_FILLER_HOME', str(home))
+        mp.setattr(cache_manager, 'BASE_DIR', home)
+        yield home
+
+
+@pytest.fixture(scope="module")
+def client(data_home):
+    """创建测试客户端（每个测试模块一个，lifespan 只启动一次）"""
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """异步测试使用 asyncio 事件循环"""
+    return 'asyncio'
+
+
+@pytest.fixture
+async def async_client():
+    """直接调用 ASGI 应用的异步客户端，可在一个测试中并发发送请求"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def template_bytes():
+    """测试模板内容（每个测试模块只读取一次磁盘）"""
+    if TEMPLATE_MISSING:
+        pytest.skip("测试模板文件不存在")
+    with open(TEMPLATE_PATH, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def upload_session(client, template_bytes):
+    """上传测试模板，返回新会话的 session_id（使用内存中的模板内容）"""
+    response = client.post(
+        '/api/upload-template',
+        files={'file': ('test.docx', io.BytesIO(template_bytes), DOCX_MIME)}
+    )
+    assert response.status_code == 200
+    return response.json()['session_id']
+
+
+@pytest.fixture(scope="module")
+def uploaded_session(client, template_bytes):
+    """模块内共用的已上传会话，供不删除、不依赖会话初始状态的测试使用"""
+    response = client.post(
+        '/api/upload-template',
+        files={'file': ('test.docx', io.BytesIO(template_bytes), DOCX_MIME)}
+    )
+    assert response.status_code == 200
+    return response.json()['session_id']
+
+
+@pytest.fixture(scope="module")
+def parsed_session(client, uploaded_session):
+    """已解析模板（初始化 template_html）的共用会话"""
+    client.get(f'/api/parse-template/{uploaded_session}')
+    return uploaded_session
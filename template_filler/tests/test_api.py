@@ -4,44 +4,34 @@ API 集成测试
 测试 FastAPI 后端 API 端点。
 """
 
+import asyncio
+import io
+import json
 import os
-import sys
 import pytest
-from fastapi.testclient import TestClient
 
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from template_filler.server import app
-
-
-@pytest.fixture
-def client():
-    """创建测试客户端"""
-    return TestClient(app)
-
-
-@pytest.fixture
-def test_template_path():
-    """测试模板路径"""
-    return os.path.join(
-        os.path.dirname(__file__), 
-        'test_template.docx'
-    )
+# 预先序列化的 Schema 请求体，测试中不再逐次 json.dumps
+SCHEMA_BYTES = json.dumps({
+    'placeholders': {
+        'TITLE': {
+            'prompt': '生成标题',
+            'mode': 'auto'
+        }
+    }
+}).encode()
+JSON_HEADERS = {'content-type': 'application/json'}
 
 
 class TestUploadAPI:
     """上传 API 测试"""
     
-    def test_upload_template_success(self, client, test_template_path):
+    def test_upload_template_success(self, client, template_bytes):
         """测试成功上传模板"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        with open(test_template_path, 'rb') as f:
-            response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
+        response = client.post(
+            '/api/upload-template',
+            files={'file': ('test.docx', io.BytesIO(template_bytes), 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
+        )
         
         assert response.status_code == 200
         data = response.json()
@@ -56,33 +46,32 @@ class TestUploadAPI:
         )
         
         assert response.status_code == 400
-
-
-class TestParseTemplateAPI:
-    """模板解析 API 测试"""
     
-    def test_parse_template(self, client, test_template_path):
-        """测试模板解析"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        # 先上传
-        with open(test_template_path, 'rb') as f:
-            upload_response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
+    
+    def test_upload_too_large(self, client, monkeypatch):
+        """测试上传超过大小上限的文件"""
+        from template_filler import server
+        monkeypatch.setattr(server, 'MAX_UPLOAD_SIZE', 16)
         
-        session_id = upload_response.json()['session_id']
+        response = client.post(
+            '/api/upload-template',
+            files={'file': ('big.docx', b'PK\x03\x04' + b'x' * 60, 'application/octet-stream')}
+        )
         
-        # 解析模板
-        response = client.get(f'/api/parse-template/{session_id}')
+        assert response.status_code == 413
+    
+    def test_upload_not_zip(self, client):
+        """测试上传扩展名为 .docx 但内容不是 ZIP 的文件"""
+        response = client.post(
+            '/api/upload-template',
+            files={'file': ('fake.docx', b'hello world', 'application/octet-stream')}
+        )
         
-        assert response.status_code == 200
-        data = response.json()
-        assert 'html' in data
-        assert 'placeholders' in data
-        assert 'suggested_schema' in data
+        assert response.status_code == 400
+
+
+class TestParseTemplateAPI:
+    """模板解析 API 测试"""
     
     def test_parse_invalid_session(self, client):
         """测试无效会话"""
@@ -90,88 +79,104 @@ class TestParseTemplateAPI:
         assert response.status_code == 404
 
 
-class TestContextAPI:
-    """上下文设置 API 测试"""
+class TestSessionWorkflowAPI:
+    """同一会话上互不依赖的解析、上下文、Schema 请求"""
     
-    def test_set_context(self, client, test_template_path):
-        """测试设置上下文"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
+    @pytest.mark.anyio
+    async def test_parse_and_configure_concurrently(self, async_client, uploaded_session):
+        """测试并发解析模板、设置上下文和 Schema"""
+        session_id = uploaded_session
         
-        # 先上传
-        with open(test_template_path, 'rb') as f:
-            upload_response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
+        parsed, context, schema_response = await asyncio.gather(
+            async_client.get(f'/api/parse-template/{session_id}'),
+            async_client.post(f'/api/set-context/{session_id}', data={'context': '这是测试上下文内容'}),
+            async_client.post(f'/api/set-schema/{session_id}', content=SCHEMA_BYTES, headers=JSON_HEADERS),
+        )
         
-        session_id = upload_response.json()['session_id']
+        assert parsed.status_code == 200
+        data = parsed.json()
+        assert 'html' in data
+        assert 'placeholders' in data
+        assert 'suggested_schema' in data
         
-        # 设置上下文
-        response = client.post(
-            f'/api/set-context/{session_id}',
-            data={'context': '这是测试上下文内容'}
-        )
+        assert context.status_code == 200
+        assert context.json()['success'] is True
         
-        assert response.status_code == 200
-        assert response.json()['success'] is True
+        assert schema_response.status_code == 200
+        assert schema_response.json()['success'] is True
 
 
-class TestSchemaAPI:
-    """Schema 设置 API 测试"""
+class TestRegenerateAPI:
+    """重新生成 API 测试"""
     
-    def test_set_schema(self, client, test_template_path):
-        """测试设置 Schema"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        # 先上传
-        with open(test_template_path, 'rb') as f:
-            upload_response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
-        
-        session_id = upload_response.json()['session_id']
-        
-        # 设置 Schema
-        schema = {
+    def test_regenerate_multiple_options(self, client, upload_session, monkeypatch):
+        """测试 select 模式重新生成多个候选"""
+        class FakeLLMClient:
+            async def agenerate(self, prompt, system_prompt=None):
+                return '单个结果'
+            
+            async def agenerate_multiple(self, prompt, count=3, system_prompt=None):
+                assert '测试上下文' in prompt
+                # 与预览共用会话的系统 Prompt
+                assert system_prompt == PromptEngine.DEFAULT_SYSTEM_PROMPT
+                return [f'候选{i}' for i in range(count)]
+        
+        from template_filler import server
+        from template_filler.prompt_engine import PromptEngine
+        monkeypatch.setattr(server, 'LLMClient', FakeLLMClient)
+        
+        session_id = upload_session
+        client.post(f'/api/set-context/{session_id}', data={'context': '测试上下文'})
+        client.post(f'/api/set-schema/{session_id}', json={
             'placeholders': {
-                'TITLE': {
-                    'prompt': '生成标题',
-                    'mode': 'auto'
-                }
+                'TITLE': {'prompt': '生成标题', 'mode': 'llm', 'options_count': 3}
             }
-        }
+        })
         
-        response = client.post(
-            f'/api/set-schema/{session_id}',
-            json=schema
-        )
+        response = client.post('/api/regenerate', json={'session_id': session_id, 'placeholder': 'TITLE'})
         
         assert response.status_code == 200
-        assert response.json()['success'] is True
+        assert response.json()['content'] == ['候选0', '候选1', '候选2']
+    
+    def test_regenerate_shared_prefix(self, client, upload_session, monkeypatch):
+        """测试不同占位符的 Prompt 共享逐字节相同的前缀（系统 Prompt + 原始材料块）"""
+        calls = []
+        
+        class FakeLLMClient:
+            async def agenerate(self, prompt, system_prompt=None):
+                calls.append((system_prompt, prompt))
+                return '结果'
+        
+        from template_filler import server
+        from template_filler.prompt_engine import PromptEngine
+        monkeypatch.setattr(server, 'LLMClient', FakeLLMClient)
+        
+        session_id = upload_session
+        client.post(f'/api/set-context/{session_id}', data={'context': '测试上下文'})
+        client.post(f'/api/set-schema/{session_id}', json={
+            'placeholders': {
+                'TITLE': {'prompt': '生成标题', 'mode': 'llm'},
+                'SUMMARY': {'prompt': '生成摘要', 'mode': 'llm'}
+            }
+        })
+        for placeholder in ('TITLE', 'SUMMARY'):
+            response = client.post('/api/regenerate', json={'session_id': session_id, 'placeholder': placeholder})
+            assert response.status_code == 200
+        
+        session = server.sessions[session_id]
+        context_block = PromptEngine(session['context'], session['schema'])._context_block
+        (system_a, prompt_a), (system_b, prompt_b) = calls
+        assert system_a == system_b == PromptEngine.DEFAULT_SYSTEM_PROMPT
+        assert prompt_a.startswith(context_block) and prompt_b.startswith(context_block)
+        assert prompt_a != prompt_b
 
 
 class TestPreviewFilledAPI:
     """填充预览 API 测试"""
     
-    def test_preview_filled(self, client, test_template_path):
+    def test_preview_filled(self, client, parsed_session):
         """测试填充预览"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        # 上传并解析
-        with open(test_template_path, 'rb') as f:
-            upload_response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
-        
-        session_id = upload_response.json()['session_id']
-        
-        # 解析模板（初始化 template_html）
-        client.get(f'/api/parse-template/{session_id}')
+        session_id = parsed_session
         
         # 预览填充
         response = client.post(
@@ -191,22 +196,74 @@ class TestPreviewFilledAPI:
         assert '测试标题' in data['html']
 
 
+class TestStatsAPI:
+    """统计 API 测试"""
+    
+    def test_get_stats(self, client, data_home):
+        """测试获取缓存统计（使用 lifespan 创建的共享缓存，不触碰真实的数据目录）"""
+        from template_filler import server
+        
+        response = client.get('/api/stats')
+        
+        assert response.status_code == 200
+        stats = response.json()['llm_cache']
+        assert 'hits' in stats
+        assert 'misses' in stats
+        assert stats['cache_dir'] == str(data_home / 'cache')
+        assert server.app.state.llm_cache.cache_dir == data_home / 'cache'
+
+
+class TestDownloadAPI:
+    """下载 API 测试"""
+    
+    def test_download_not_modified(self, client, upload_session):
+        """测试 ETag 条件请求返回 304"""
+        from template_filler import server
+        session_id = upload_session
+        # 直接以上传的模板作为输出文件
+        server.sessions[session_id]['output_path'] = server.sessions[session_id]['template_path']
+        
+        response = client.get(f'/api/download/{session_id}')
+        assert response.status_code == 200
+        etag = response.headers['etag']
+        
+        response = client.get(f'/api/download/{session_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+
+
+class TestTempFileCleanup:
+    """临时文件清理测试"""
+    
+    def test_remove_stale_files(self, monkeypatch, tmp_path):
+        """测试只删除过期且不属于现存会话的文件"""
+        from template_filler import server
+        monkeypatch.setattr(server, 'UPLOAD_DIR', tmp_path)
+        monkeypatch.setattr(server, 'OUTPUT_DIR', tmp_path)
+        
+        stale = tmp_path / 'stale.docx'
+        kept = tmp_path / 'kept.docx'
+        fresh = tmp_path / 'fresh.docx'
+        for path in (stale, kept, fresh):
+            path.write_bytes(b'docx')
+        old = 0
+        os.utime(stale, (old, old))
+        os.utime(kept, (old, old))
+        
+        removed = server._remove_stale_files({str(kept)}, 3600)
+        
+        assert removed == 1
+        assert not stale.exists()
+        assert kept.exists()
+        assert fresh.exists()
+
+
 class TestSessionAPI:
     """会话管理 API 测试"""
     
-    def test_delete_session(self, client, test_template_path):
+    def test_delete_session(self, client, upload_session):
         """测试删除会话"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        # 先上传
-        with open(test_template_path, 'rb') as f:
-            upload_response = client.post(
-                '/api/upload-template',
-                files={'file': ('test.docx', f, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            )
-        
-        session_id = upload_response.json()['session_id']
+        session_id = upload_session
         
         # 删除会话
         response = client.delete(f'/api/session/{session_id}')
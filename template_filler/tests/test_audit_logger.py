@@ -0,0 +1,42 @@
+"""
+单元测试：AuditLogger 操作日志
+
+测试共享写入线程的落盘，以及写入失败后 flush 不阻塞、后续记录恢复写入。
+"""
+
+import shutil
+import time
+
+from template_filler.audit_logger import AuditLogger, _AuditWriter
+
+
+class TestAuditLogger:
+    """AuditLogger 单元测试"""
+    
+    def test_shared_writer(self, tmp_path):
+        """测试同一目录的多个实例共用写入线程"""
+        first = AuditLogger(str(tmp_path))
+        second = AuditLogger(str(tmp_path))
+        assert first._writer is second._writer
+        
+        op_id = first.log_operation('fill', 'test.docx', ['TITLE'])
+        assert second.get_operation(op_id)['placeholders'] == ['TITLE']
+        first.close()
+    
+    def test_flush_after_failed_write(self, tmp_path, monkeypatch):
+        """测试写盘失败时 flush 立即返回，写入线程继续处理后续记录"""
+        monkeypatch.setattr(_AuditWriter, 'FLUSH_TIMEOUT', 5.0)
+        log_dir = tmp_path / 'logs'
+        audit = AuditLogger(str(log_dir))
+        
+        # 日志目录被删除，打开当天文件失败
+        shutil.rmtree(log_dir)
+        lost = audit.log_operation('fill', 'test.docx', ['TITLE'])
+        start = time.monotonic()
+        assert audit.get_operation(lost) is None
+        assert time.monotonic() - start < 1.0
+        
+        log_dir.mkdir()
+        op_id = audit.log_operation('fill', 'test.docx', ['SUMMARY'])
+        assert audit.get_operation(op_id)['placeholders'] == ['SUMMARY']
+        audit.close()
@@ -5,68 +5,61 @@
 """
 
 import os
-import sys
 import pytest
-import tempfile
-import shutil
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from template_filler.cache_manager import CacheManager
 
 
+@pytest.fixture(scope="module")
+def shared_cache(tmp_path_factory):
+    """共用的缓存管理器（整个模块只初始化一次缓存目录），各测试使用互不重叠的 prompt"""
+    return CacheManager(cache_dir=str(tmp_path_factory.mktemp('shared_cache')))
+
+
+@pytest.fixture(scope="module")
+def key_cache():
+    """键生成测试共用的禁用缓存管理器（不需要实际存储）"""
+    return CacheManager(enabled=False)
+
+
 class TestCacheManager:
     """CacheManager 单元测试"""
     
-    @pytest.fixture
-    def temp_cache_dir(self):
-        """创建临时缓存目录"""
-        temp_dir = tempfile.mkdtemp()
-        yield temp_dir
-        # 清理
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    
-    def test_init_creates_directory(self, temp_cache_dir):
+    def test_init_creates_directory(self, tmp_path):
         """测试初始化创建目录"""
-        cache_path = os.path.join(temp_cache_dir, 'cache')
+        cache_path = str(tmp_path / 'cache')
         cache = CacheManager(cache_dir=cache_path)
         assert os.path.exists(cache_path)
     
-    def test_set_and_get(self, temp_cache_dir):
+    @pytest.mark.parametrize("prompt,response,model", [
+        ("测试提示语", "测试响应", "gpt-4"),
+        ("另一个提示语", "另一个响应", "gpt-3.5-turbo"),
+    ])
+    def test_set_and_get(self, shared_cache, prompt, response, model):
         """测试存储和获取"""
-        cache = CacheManager(cache_dir=temp_cache_dir)
-        
-        prompt = "测试提示语"
-        response = "测试响应"
-        model = "gpt-4"
-        
-        cache.set(prompt, response, model)
-        result = cache.get(prompt, model)
+        shared_cache.set(prompt, response, model)
         
-        assert result == response
+        assert shared_cache.get(prompt, model) == response
     
-    def test_get_miss(self, temp_cache_dir):
-        """测试缓存未命中"""
-        cache = CacheManager(cache_dir=temp_cache_dir)
-        
-        result = cache.get("不存在的提示语", "gpt-4")
+    @pytest.mark.parametrize("cache_fixture", ['shared_cache', 'key_cache'])
+    def test_get_miss(self, request, cache_fixture):
+        """测试缓存未命中（启用与禁用缓存均返回 None）"""
+        result = request.getfixturevalue(cache_fixture).get("不存在的提示语", "gpt-4")
         assert result is None
     
-    def test_different_models(self, temp_cache_dir):
+    def test_different_models(self, shared_cache):
         """测试不同模型的缓存隔离"""
-        cache = CacheManager(cache_dir=temp_cache_dir)
-        
         prompt = "同一个提示语"
         
-        cache.set(prompt, "GPT-4响应", "gpt-4")
-        cache.set(prompt, "GPT-3.5响应", "gpt-3.5-turbo")
+        shared_cache.set(prompt, "GPT-4响应", "gpt-4")
+        shared_cache.set(prompt, "GPT-3.5响应", "gpt-3.5-turbo")
         
-        assert cache.get(prompt, "gpt-4") == "GPT-4响应"
-        assert cache.get(prompt, "gpt-3.5-turbo") == "GPT-3.5响应"
+        assert shared_cache.get(prompt, "gpt-4") == "GPT-4响应"
+        assert shared_cache.get(prompt, "gpt-3.5-turbo") == "GPT-3.5响应"
     
-    def test_clear(self, temp_cache_dir):
+    def test_clear(self, tmp_path):
         """测试清除缓存"""
-        cache = CacheManager(cache_dir=temp_cache_dir)
+        cache = CacheManager(cache_dir=str(tmp_path))
         
         cache.set("prompt1", "response1", "gpt-4")
         cache.set("prompt2", "response2", "gpt-4")
@@ -77,18 +70,115 @@ class TestCacheManager:
         assert cache.get("prompt1", "gpt-4") is None
         assert cache.get("prompt2", "gpt-4") is None
     
-    def test_disabled_cache(self, temp_cache_dir):
+    def test_key_reuse(self, tmp_path):
+        """测试复用缓存键存取"""
+        cache = CacheManager(cache_dir=str(tmp_path))
+        
+        key = cache.make_key("prompt", "gpt-4", "system")
+        cache.set_by_key(key, "prompt", "response", "gpt-4")
+        
+        assert cache.get("prompt", "gpt-4", "system") == "response"
+        assert cache.get_by_key(key) == "response"
+    
+    def test_get_many(self, tmp_path):
+        """测试批量获取"""
+        cache = CacheManager(cache_dir=str(tmp_path))
+        
+        cache.set("prompt1", "response1", "gpt-4", "system")
+        cache.set("prompt2", "response2", "gpt-4")
+        cache.flush()
+        
+        result = cache.get_many(
+            [("prompt1", "system"), ("prompt2", ""), ("prompt3", "")],
+            "gpt-4"
+        )
+        assert result == ["response1", "response2", None]
+    
+    def test_memory_hit_skips_disk(self, tmp_path):
+        """测试内存缓存命中时不读取磁盘"""
+        cache = CacheManager(cache_dir=str(tmp_path))
+        
+        cache.set("prompt", "response", "gpt-4")
+        cache.flush()
+        for path in tmp_path.iterdir():
+            path.unlink()
+        
+        assert cache.get("prompt", "gpt-4") == "response"
+    
+    def test_reload_from_log(self, tmp_path):
+        """测试从日志文件重建索引"""
+        from template_filler import cache_manager
+        
+        cache = CacheManager(cache_dir=str(tmp_path))
+        cache.set("prompt", "response", "gpt-4")
+        cache.flush()
+        
+        # 丢弃共享日志，模拟新进程启动
+        cache_manager._logs.clear()
+        
+        assert CacheManager(cache_dir=str(tmp_path)).get("prompt", "gpt-4") == "response"
+    
+    def test_compact_drops_expired(self, tmp_path):
+        """测试压缩删除过期条目"""
+        cache = CacheManager(cache_dir=str(tmp_path), ttl_hours=0)
+        
+        cache.set("prompt", "response", "gpt-4")
+        assert cache.get("prompt", "gpt-4") is None
+        
+        assert cache.compact() == 1
+        assert cache.get_stats()['count'] == 0
+    
+    def test_compact_by_other_process(self, tmp_path):
+        """测试其他进程压缩（替换日志文件）后仍能读到新记录，且写入不落到旧文件"""
+        import time
+        from template_filler.cache_manager import _CacheLog
+        
+        path = tmp_path / 'cache.bin'
+        writer, reader = _CacheLog(path), _CacheLog(path)
+        writer.put('0' * 32, time.time() - 7200, {'response': 'expired'})
+        writer.put('1' * 32, time.time(), {'response': 'live'})
+        writer.flush()
+        assert reader.get('0' * 32)[1] == 'expired'
+        
+        assert writer.compact(3600) == 1
+        writer.put('2' * 32, time.time(), {'response': 'fresh'})
+        writer.flush()
+        
+        assert reader.get('2' * 32)[1] == 'fresh'
+        assert reader.get('1' * 32)[1] == 'live'
+        
+        reader.put('3' * 32, time.time(), {'response': 'from reader'})
+        reader.flush()
+        assert _CacheLog(path).get('3' * 32)[1] == 'from reader'
+    
+    def test_corrupt_record_stops_scan(self, tmp_path):
+        """测试损坏的记录头不会导致读取报错"""
+        import time
+        from template_filler.cache_manager import _CacheLog
+        
+        path = tmp_path / 'cache.bin'
+        log = _CacheLog(path)
+        log.put('a' * 32, time.time(), {'response': 'ok'})
+        log.flush()
+        with open(path, 'ab') as f:
+            f.write(b'\xff' * 64)
+        
+        fresh = _CacheLog(path)
+        assert fresh.get('a' * 32)[1] == 'ok'
+        assert fresh.get('b' * 32) is None
+    
+    def test_disabled_cache(self, tmp_path):
         """测试禁用缓存"""
-        cache = CacheManager(cache_dir=temp_cache_dir, enabled=False)
+        cache = CacheManager(cache_dir=str(tmp_path), enabled=False)
         
         cache.set("prompt", "response", "gpt-4")
         result = cache.get("prompt", "gpt-4")
         
         assert result is None
     
-    def test_get_stats(self, temp_cache_dir):
+    def test_get_stats(self, tmp_path):
         """测试统计信息"""
-        cache = CacheManager(cache_dir=temp_cache_dir)
+        cache = CacheManager(cache_dir=str(tmp_path))
         
         cache.set("prompt1", "response1", "gpt-4")
         cache.set("prompt2", "response2", "gpt-4")
@@ -98,26 +188,37 @@ class TestCacheManager:
         assert stats['count'] == 2
         assert stats['size_bytes'] > 0
         assert 'cache_dir' in stats
+    
+    def test_hit_miss_counters(self, tmp_path):
+        """测试命中 / 未命中计数"""
+        cache = CacheManager(cache_dir=str(tmp_path))
+        
+        cache.set("prompt1", "response1", "gpt-4")
+        cache.get("prompt1", "gpt-4")
+        cache.get("missing", "gpt-4")
+        cache.get_many([("prompt1", ""), ("missing", "")], "gpt-4")
+        
+        stats = cache.get_stats()
+        
+        assert stats['hits'] == 2
+        assert stats['misses'] == 2
+        assert stats['hit_rate'] == 0.5
 
 
 class TestCacheKeyGeneration:
     """缓存键生成测试"""
     
-    def test_same_inputs_same_key(self):
+    def test_same_inputs_same_key(self, key_cache):
         """相同输入应生成相同的键"""
-        cache = CacheManager(enabled=False)  # 不需要实际存储
-        
-        key1 = cache._generate_key("prompt", "model", "system")
-        key2 = cache._generate_key("prompt", "model", "system")
+        key1 = key_cache._generate_key("prompt", "model", "system")
+        key2 = key_cache._generate_key("prompt", "model", "system")
         
         assert key1 == key2
     
-    def test_different_inputs_different_keys(self):
+    def test_different_inputs_different_keys(self, key_cache):
         """不同输入应生成不同的键"""
-        cache = CacheManager(enabled=False)
-        
-        key1 = cache._generate_key("prompt1", "model", "system")
-        key2 = cache._generate_key("prompt2", "model", "system")
+        key1 = key_cache._generate_key("prompt1", "model", "system")
+        key2 = key_cache._generate_key("prompt2", "model", "system")
         
         assert key1 != key2
 
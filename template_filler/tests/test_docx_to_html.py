@@ -5,32 +5,30 @@
 """
 
 import os
-import sys
+import re
 import pytest
 
-# 添加项目路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from template_filler.docx_to_html import DocxToHtml
 
 
+@pytest.mark.requires_template
 class TestDocxToHtml:
     """DocxToHtml 单元测试"""
     
-    @pytest.fixture
-    def test_template_path(self):
-        """测试模板路径"""
-        return os.path.join(
-            os.path.dirname(__file__), 
-            'test_template.docx'
-        )
+    @pytest.fixture(scope="module")
+    def converter(self, test_template_path):
+        """已完成转换的共享转换器（整个模块只解析一次模板）"""
+        converter = DocxToHtml(test_template_path)
+        converter.convert()
+        return converter
+    
+    @pytest.fixture(scope="module")
+    def highlighted(self, test_template_path):
+        """高亮占位符后的转换结果"""
+        return DocxToHtml(test_template_path).convert_with_highlight()
     
-    def test_convert_basic(self, test_template_path):
+    def test_convert_basic(self, converter):
         """测试基本转换功能"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        converter = DocxToHtml(test_template_path)
         result = converter.convert()
         
         assert 'html' in result
@@ -39,38 +37,42 @@ class TestDocxToHtml:
         assert isinstance(result['placeholders'], list)
         assert len(result['html']) > 0
     
-    def test_extract_placeholders(self, test_template_path):
+    def test_extract_placeholders(self, converter):
         """测试占位符提取"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        converter = DocxToHtml(test_template_path)
-        result = converter.convert()
-        
         # 测试模板应该包含这些占位符
         expected_placeholders = ['TITLE', 'SUMMARY', 'KEYWORDS', 'SIGNIFICANCE']
         for placeholder in expected_placeholders:
-            assert placeholder in result['placeholders'], f"缺少占位符: {placeholder}"
+            assert placeholder in converter.placeholders, f"缺少占位符: {placeholder}"
     
-    def test_highlight_placeholders(self, test_template_path):
+    def test_highlight_placeholders(self, highlighted):
         """测试占位符高亮"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
+        assert 'class="placeholder"' in highlighted['html']
+        assert 'data-name=' in highlighted['html']
+    
+    def test_convert_cached(self, test_template_path, monkeypatch):
+        """测试相同文件的重复转换复用缓存"""
+        first = DocxToHtml(test_template_path).convert()
         
-        converter = DocxToHtml(test_template_path)
-        result = converter.convert_with_highlight()
+        import mammoth
+        def fail(*args, **kwargs):
+            raise AssertionError("不应重复调用 mammoth")
+        monkeypatch.setattr(mammoth, 'convert_to_html', fail)
         
-        assert 'class="placeholder"' in result['html']
-        assert 'data-name=' in result['html']
+        second = DocxToHtml(test_template_path).convert()
+        assert second == first
+    
+    def test_convert_memoized(self, test_template_path):
+        """测试同一实例重复转换直接返回已有结果（文件对象只读取一次）"""
+        with open(test_template_path, 'rb') as f:
+            converter = DocxToHtml(file_obj=f)
+            first = converter.convert()
+            second = converter.convert()
+        
+        assert second == first
+        assert second['html'] is first['html']
     
-    def test_fill_html(self, test_template_path):
+    def test_fill_html(self, converter):
         """测试 HTML 填充"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
-        converter = DocxToHtml(test_template_path)
-        converter.convert()
-        
         content_map = {
             'TITLE': '测试标题',
             'SUMMARY': '测试摘要内容'
@@ -82,48 +84,52 @@ class TestDocxToHtml:
         assert '测试摘要内容' in filled_html
         assert '{{TITLE}}' not in filled_html
         assert '{{SUMMARY}}' not in filled_html
+    
+    def test_fill_html_reuses_segments(self, test_template_path):
+        """测试同一模板的多个转换器复用 HTML 切分结果"""
+        first = DocxToHtml(test_template_path)
+        first.convert()
+        first_html = first.fill_html({'TITLE': '标题一'})
+        
+        second = DocxToHtml(test_template_path)
+        second.convert()
+        second_html = second.fill_html({'TITLE': '标题二'})
+        
+        assert second._segments is first._segments
+        assert '标题一' in first_html
+        assert '标题二' in second_html
 
 
 class TestPlaceholderPattern:
     """占位符正则表达式测试"""
     
-    def test_pattern_basic(self):
+    PATTERN = DocxToHtml.PLACEHOLDER_PATTERN
+    
+    def test_pattern_precompiled(self):
+        """测试占位符正则在类定义时已编译"""
+        assert isinstance(self.PATTERN, re.Pattern)
+    
+    @pytest.mark.parametrize("text,expected", [
+        ('{{TITLE}}', ['TITLE']),
+        ('{{NAME}}', ['NAME']),
+        ('Hello {{WORLD}}!', ['WORLD']),
+        ('{{A}} and {{B}}', ['A', 'B']),
+        ('No placeholders here', []),
+        ('{{lowercase}}', ['lowercase']),
+        ('{{MixedCase123}}', ['MixedCase123']),
+    ])
+    def test_pattern_basic(self, text, expected):
         """测试基本占位符匹配"""
-        from template_filler.docx_to_html import DocxToHtml
-        
-        pattern = DocxToHtml.PLACEHOLDER_PATTERN
-        
-        test_cases = [
-            ('{{TITLE}}', ['TITLE']),
-            ('{{NAME}}', ['NAME']),
-            ('Hello {{WORLD}}!', ['WORLD']),
-            ('{{A}} and {{B}}', ['A', 'B']),
-            ('No placeholders here', []),
-            ('{{lowercase}}', ['lowercase']),
-            ('{{MixedCase123}}', ['MixedCase123']),
-        ]
-        
-        for text, expected in test_cases:
-            matches = pattern.findall(text)
-            assert matches == expected, f"输入: {text}, 期望: {expected}, 实际: {matches}"
+        assert self.PATTERN.findall(text) == expected
     
-    def test_pattern_edge_cases(self):
-        """测试边界情况"""
-        from template_filler.docx_to_html import DocxToHtml
-        
-        pattern = DocxToHtml.PLACEHOLDER_PATTERN
-        
-        # 不应匹配的情况
-        invalid_cases = [
-            '{TITLE}',      # 单花括号
-            '{{ TITLE }}',  # 有空格（当前pattern不匹配）
-            '{{}}',         # 空占位符
-        ]
-        
-        for text in invalid_cases:
-            matches = pattern.findall(text)
-            # 根据当前正则，这些应该返回空或不完整匹配
-            # 这里只是记录行为
+    @pytest.mark.parametrize("text", [
+        '{TITLE}',      # 单花括号
+        '{{ TITLE }}',  # 有空格（当前pattern不匹配）
+        '{{}}',         # 空占位符
+    ])
+    def test_pattern_edge_cases(self, text):
+        """测试边界情况：不应匹配"""
+        assert self.PATTERN.findall(text) == []
 
 
 if __name__ == '__main__':
@@ -0,0 +1,168 @@
+"""
+单元测试：ExcelParser 解析器
+
+测试 XLSX 模板的占位符查找与填充。
+"""
+
+import os
+import pytest
+import zipfile
+from openpyxl import Workbook, load_workbook
+
+from template_filler.excel_parser import ExcelParser
+
+
+class TestExcelParser:
+    """ExcelParser 单元测试"""
+    
+    @pytest.fixture
+    def temp_dir(self, tmp_path):
+        """临时目录（每个测试及 xdist 进程独立）"""
+        return str(tmp_path)
+    
+    @pytest.fixture
+    def template_path(self, temp_dir):
+        """创建包含两个工作表的测试模板"""
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = '封面'
+        sheet['A1'] = '标题：{{TITLE}}'
+        sheet['A2'] = 42
+        sheet['B2'] = '无占位符'
+        other = workbook.create_sheet('正文')
+        other['A1'] = '{{SUMMARY}} / {{TITLE}}'
+        other['C3'] = '{{UNKNOWN}}'
+        
+        path = os.path.join(temp_dir, 'template.xlsx')
+        workbook.save(path)
+        return path
+    
+    def test_find_placeholders(self, template_path):
+        """测试查找占位符"""
+        parser = ExcelParser(template_path)
+        
+        assert sorted(parser.find_placeholders()) == ['SUMMARY', 'TITLE', 'UNKNOWN']
+        parser.close()
+    
+    def test_scan_without_shared_strings(self, template_path):
+        """测试没有共享字符串表时回退为逐单元格扫描"""
+        # openpyxl 保存的工作簿使用内联字符串
+        parser = ExcelParser(template_path)
+        
+        assert parser._scan_shared_strings() is None
+        assert parser._scan_cells() == {'SUMMARY', 'TITLE', 'UNKNOWN'}
+    
+    def test_scan_shared_strings(self, template_path):
+        """测试扫描共享字符串表（含富文本与注音）"""
+        with zipfile.ZipFile(template_path, 'a') as archive:
+            archive.writestr('xl/sharedStrings.xml', (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<si><t>标题：{{TITLE}}</t></si>'
+                '<si><r><t>{{SUM</t></r><r><t>MARY}}</t></r></si>'
+                '<si><t>姓名</t><rPh><t>{{PHONETIC}}</t></rPh></si>'
+                '</sst>'
+            ))
+        parser = ExcelParser(template_path)
+        
+        assert parser._scan_shared_strings() == {'TITLE', 'SUMMARY'}
+    
+    def test_find_formula_placeholders(self, temp_dir):
+        """测试有共享字符串表时仍能找到公式和内联字符串中的占位符"""
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet['A1'] = '{{name}}'
+        sheet['A2'] = '="{{total}}"'
+        path = os.path.join(temp_dir, 'formula.xlsx')
+        workbook.save(path)
+        
+        parser = ExcelParser(path)
+        # 没有共享字符串表：逐单元格扫描按公式文本匹配
+        assert sorted(parser.find_placeholders()) == ['name', 'total']
+        
+        with zipfile.ZipFile(path, 'a') as archive:
+            archive.writestr('xl/sharedStrings.xml', (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<si><t>{{shared}}</t></si>'
+                '</sst>'
+            ))
+        assert sorted(parser.find_placeholders()) == ['name', 'shared', 'total']
+    
+    def test_fill_and_save(self, template_path, temp_dir):
+        """测试填充并保存"""
+        parser = ExcelParser(template_path)
+        parser.fill_placeholders({'TITLE': '年度报告', 'SUMMARY': '摘要'})
+        
+        output_path = os.path.join(temp_dir, 'output.xlsx')
+        parser.save(output_path)
+        parser.close()
+        
+        workbook = load_workbook(output_path)
+        assert workbook['封面']['A1'].value == '标题：年度报告'
+        assert workbook['封面']['A2'].value == 42
+        assert workbook['正文']['A1'].value == '摘要 / 年度报告'
+        # 未提供内容的占位符保持原样
+        assert workbook['正文']['C3'].value == '{{UNKNOWN}}'
+        workbook.close()
+    
+    
+    def test_save_text_only(self, template_path, temp_dir):
+        """测试只有文本替换时直接改写 XML，不加载可编辑工作簿"""
+        parser = ExcelParser(template_path)
+        parser.fill_placeholders({'TITLE': 'A & B <C> "D"'})
+        
+        output_path = os.path.join(temp_dir, 'output.xlsx')
+        parser.save(output_path)
+        assert parser._workbook is None
+        
+        workbook = load_workbook(output_path)
+        assert workbook['封面']['A1'].value == '标题：A & B <C> "D"'
+        assert workbook['正文']['A1'].value == '{{SUMMARY}} / A & B <C> "D"'
+        workbook.close()
+    
+    def test_rewrite_rejects_split_placeholder(self, template_path):
+        """测试占位符跨越多个富文本片段时不直接改写"""
+        parser = ExcelParser(template_path)
+        parser.fill_placeholders({'SUMMARY': '摘要'})
+        
+        assert parser._rewrite_xml('<si><r><t>{{SUM</t></r><r><t>MARY}}</t></r></si>') is None
+        assert parser._rewrite_xml('<si><t>{{SUMMARY}}</t></si>') == '<si><t>摘要</t></si>'
+    
+    def test_rewrite_only_text_nodes(self, template_path):
+        """测试直接改写只替换 <t> 文本节点，公式中的占位符交给 openpyxl"""
+        parser = ExcelParser(template_path)
+        parser.fill_placeholders({'TITLE': '标题'})
+        
+        xml = (
+            '<worksheet><c t="inlineStr"><is><t>{{TITLE}}</t></is></c>'
+            '<headerFooter><oddHeader>{{OTHER}}</oddHeader></headerFooter></worksheet>'
+        )
+        assert parser._rewrite_xml(xml) == xml.replace('<t>{{TITLE}}</t>', '<t>标题</t>')
+        assert parser._rewrite_xml('<c><f>"{{TITLE}}"</f></c>') is None
+    
+    def test_non_utf8_part_not_rewritten(self, template_path):
+        """测试非 UTF-8 编码的部件不直接改写"""
+        parser = ExcelParser(template_path)
+        
+        utf16 = '<?xml version="1.0" encoding="UTF-16"?><sst/>'
+        assert parser._decode_part(utf16.encode('utf-8')) is None
+        assert parser._decode_part('<?xml version="1.0" encoding="UTF-8"?><sst/>'.encode()) is not None
+    
+    def test_save_falls_back_to_workbook(self, template_path, temp_dir):
+        """测试内容无法直接写入 XML 时回退为完整序列化"""
+        parser = ExcelParser(template_path)
+        parser.fill_placeholders({'SUMMARY': ' 首尾空白 '})
+        
+        output_path = os.path.join(temp_dir, 'output.xlsx')
+        parser.save(output_path)
+        assert parser._workbook is not None
+        parser.close()
+        
+        workbook = load_workbook(output_path)
+        assert workbook['正文']['A1'].value == ' 首尾空白  / {{TITLE}}'
+        workbook.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,81 @@
+"""
+单元测试：LLMClient 客户端
+
+使用伪造的 OpenAI 接口测试请求构造与回退逻辑，不访问网络。
+"""
+
+import os
+import pytest
+from types import SimpleNamespace
+
+from template_filler.llm_client import LLMClient
+
+
+class FakeCompletions:
+    """按 n 参数返回候选的 chat.completions 接口"""
+    
+    def __init__(self, support_n=True):
+        self.support_n = support_n
+        self.calls = []
+    
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        n = kwargs.get('n', 1) if self.support_n else 1
+        return SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=f" 候选{len(self.calls)}-{i} "))
+            for i in range(n)
+        ])
+
+
+class TestLLMClient:
+    """LLMClient 单元测试"""
+    
+    def make_client(self, completions):
+        client = LLMClient(api_key='test-key', cache_enabled=False, retry_delay=0)
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        return client
+    
+    def test_generate_multiple_single_request(self):
+        """测试一次请求返回多个候选"""
+        completions = FakeCompletions()
+        client = self.make_client(completions)
+        
+        results = client.generate_multiple("prompt", count=3, system_prompt="system")
+        
+        assert results == ['候选1-0', '候选1-1', '候选1-2']
+        assert len(completions.calls) == 1
+        assert completions.calls[0]['n'] == 3
+        assert completions.calls[0]['messages'][0] == {"role": "system", "content": "system"}
+    
+    def test_generate_multiple_fallback(self):
+        """测试服务忽略 n 参数时逐个请求"""
+        completions = FakeCompletions(support_n=False)
+        client = self.make_client(completions)
+        
+        results = client.generate_multiple("prompt", count=3)
+        
+        assert len(results) == 3
+        assert len(completions.calls) == 4
+        assert '请提供第 3 种不同的表达方式' in completions.calls[-1]['messages'][-1]['content']
+
+    
+    def test_async_http_client_shared_per_loop(self):
+        """测试同一事件循环内的 LLMClient 共享异步连接池，asyncio.run 结束前关闭"""
+        import asyncio
+        from template_filler import llm_client
+        
+        async def main():
+            first = LLMClient(api_key='test-key', cache_enabled=False).async_client
+            second = LLMClient(api_key='test-key', cache_enabled=False).async_client
+            http_client = llm_client._async_http_clients[asyncio.get_running_loop()]
+            return first, second, http_client
+        
+        first, second, http_client = asyncio.run(llm_client.run_and_close(main()))
+        
+        assert first._client is second._client is http_client
+        assert http_client.is_closed
+        assert not any(client is http_client for client in llm_client._async_http_clients.values())
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
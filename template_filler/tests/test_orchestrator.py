@@ -0,0 +1,116 @@
+"""
+单元测试：Orchestrator 流程协调器
+
+使用伪造的 LLM 客户端测试生成任务的调度。
+"""
+
+import os
+import pytest
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from docx import Document
+from template_filler.orchestrator import Orchestrator
+
+
+class FakeLLMClient:
+    """记录调用次数的 LLM 客户端，cache 中的 prompt 视为已缓存"""
+    
+    def __init__(self, cache=None):
+        self.cache = cache or {}
+        self.calls = []
+    
+    def get_cached(self, requests):
+        return [self.cache.get(prompt) for prompt, _ in requests]
+    
+    async def agenerate(self, prompt, system_prompt=None):
+        self.calls.append(prompt)
+        return f"生成:{len(self.calls)}"
+    
+    async def agenerate_multiple(self, prompt, count=3, system_prompt=None):
+        self.calls.append(prompt)
+        return [f"选项{i}" for i in range(count)]
+
+
+SCHEMA = {
+    'placeholders': {
+        'TITLE': {'prompt': '生成标题', 'mode': 'select', 'options_count': 3},
+        'SUMMARY': {'prompt': '生成摘要', 'mode': 'auto'},
+        'SIGNIFICANCE': {'prompt': '总结意义', 'mode': 'auto'},
+        'KEYWORDS': {'prompt': '提取关键词', 'mode': 'auto'},
+    }
+}
+
+
+@pytest.mark.requires_template
+class TestOrchestrator:
+    """Orchestrator 单元测试"""
+    
+    @pytest.fixture
+    def temp_dir(self, tmp_path):
+        """临时目录（每个测试及 xdist 进程独立）"""
+        return str(tmp_path)
+    
+    def test_run_fills_all_placeholders(self, test_template_path, temp_dir):
+        """测试填充所有占位符"""
+        client = FakeLLMClient()
+        orchestrator = Orchestrator(test_template_path, "原始材料", SCHEMA, llm_client=client)
+        
+        result = orchestrator.run(os.path.join(temp_dir, 'output.docx'))
+        
+        assert set(result['filled_placeholders']) == set(SCHEMA['placeholders'])
+        assert result['options']['TITLE'] == ['选项0', '选项1', '选项2']
+        assert os.path.exists(result['output_path'])
+    
+    def test_run_with_process_pool(self, test_template_path, temp_dir):
+        """测试在进程池中填充并保存文档"""
+        client = FakeLLMClient()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            orchestrator = Orchestrator(test_template_path, "原始材料", SCHEMA, llm_client=client, executor=pool)
+            result = orchestrator.run(os.path.join(temp_dir, 'output.docx'))
+        
+        text = '\n'.join(p.text for p in Document(result['output_path']).paragraphs)
+        assert result['filled_placeholders']['SUMMARY'] in text
+        assert '{{SUMMARY}}' not in text
+    
+    def test_cached_placeholders_skip_generation(self, test_template_path, temp_dir):
+        """测试命中缓存的占位符不再调用 LLM"""
+        orchestrator = Orchestrator(test_template_path, "原始材料", SCHEMA, llm_client=FakeLLMClient())
+        summary_prompt = orchestrator.prompt_engine.build_prompt('SUMMARY')
+        client = FakeLLMClient({summary_prompt: '缓存的摘要'})
+        orchestrator.llm_client = client
+        
+        result = orchestrator.run(os.path.join(temp_dir, 'output.docx'))
+        
+        assert result['filled_placeholders']['SUMMARY'] == '缓存的摘要'
+        assert summary_prompt not in client.calls
+        assert len(client.calls) == 3
+    
+    def test_duplicate_prompts_generated_once(self, test_template_path, temp_dir):
+        """测试相同 prompt 的占位符只请求一次"""
+        schema = {'placeholders': {
+            'SUMMARY': {'prompt': '生成摘要', 'mode': 'auto'},
+            'SIGNIFICANCE': {'prompt': '生成摘要', 'mode': 'auto'},
+        }}
+        client = FakeLLMClient()
+        orchestrator = Orchestrator(test_template_path, "原始材料", schema, llm_client=client)
+        
+        result = orchestrator.run(os.path.join(temp_dir, 'output.docx'))
+        
+        assert len(client.calls) == 1
+        assert result['filled_placeholders']['SUMMARY'] == result['filled_placeholders']['SIGNIFICANCE']
+    
+    def test_preview_uses_cache(self, test_template_path):
+        """测试预览命中缓存"""
+        orchestrator = Orchestrator(test_template_path, "原始材料", SCHEMA, llm_client=FakeLLMClient())
+        keywords_prompt = orchestrator.prompt_engine.build_prompt('KEYWORDS')
+        orchestrator.llm_client = FakeLLMClient({keywords_prompt: '缓存的关键词'})
+        
+        result = orchestrator.preview()['placeholders']
+        
+        assert result['KEYWORDS'] == {'mode': 'auto', 'content': ['缓存的关键词'], 'selected': 0}
+        assert len(result['TITLE']['content']) == 3
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
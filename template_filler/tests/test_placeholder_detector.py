@@ -5,35 +5,23 @@
 """
 
 import os
-import sys
 import pytest
 
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from template_filler.placeholder_detector import PlaceholderDetector
 
 
+@pytest.fixture(scope="module")
+def detector():
+    """共享检测器实例（测试不修改其内部状态）"""
+    return PlaceholderDetector()
+
+
 class TestPlaceholderDetector:
     """PlaceholderDetector 单元测试"""
     
-    @pytest.fixture
-    def detector(self):
-        """创建检测器实例"""
-        return PlaceholderDetector()
-    
-    @pytest.fixture
-    def test_template_path(self):
-        """测试模板路径"""
-        return os.path.join(
-            os.path.dirname(__file__), 
-            'test_template.docx'
-        )
-    
+    @pytest.mark.requires_template
     def test_detect_docx(self, detector, test_template_path):
         """测试 DOCX 文件检测"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
         schema = detector.detect(test_template_path)
         
         assert 'placeholders' in schema
@@ -85,11 +73,9 @@ class TestPlaceholderDetector:
         assert 'options_count' in schema['placeholders']['TITLE']
         assert schema['placeholders']['TITLE']['options_count'] == 3
     
+    @pytest.mark.requires_template
     def test_analyze_template(self, detector, test_template_path):
         """测试模板分析功能"""
-        if not os.path.exists(test_template_path):
-            pytest.skip("测试模板文件不存在")
-        
         result = detector.analyze_template(test_template_path)
         
         assert 'file' in result
@@ -107,10 +93,8 @@ class TestPlaceholderDetector:
 class TestCommonPrompts:
     """常见占位符提示语测试"""
     
-    def test_chinese_placeholders(self):
+    def test_chinese_placeholders(self, detector):
         """测试中文占位符"""
-        detector = PlaceholderDetector()
-        
         placeholders = ['标题', '摘要', '关键词']
         schema = detector._generate_schema(placeholders)
         
@@ -118,10 +102,8 @@ class TestCommonPrompts:
             assert name in schema['placeholders']
             assert schema['placeholders'][name]['prompt']
     
-    def test_unknown_placeholders(self):
+    def test_unknown_placeholders(self, detector):
         """测试未知占位符"""
-        detector = PlaceholderDetector()
-        
         placeholders = ['CUSTOM_FIELD', 'XYZ123']
         schema = detector._generate_schema(placeholders)
         
@@ -130,6 +112,16 @@ class TestCommonPrompts:
             assert name in schema['placeholders']
             prompt = schema['placeholders'][name]['prompt']
             assert name in prompt or name.lower() in prompt.lower()
+    
+    
+    def test_partial_match(self, detector):
+        """测试部分匹配（包含常见键、为常见键的子串，多个命中时按定义顺序）"""
+        common = PlaceholderDetector.COMMON_PROMPTS
+        
+        assert detector._get_suggested_prompt('PROJECT_TITLE') == common['TITLE']
+        assert detector._get_suggested_prompt('NAME_TITLE') == common['TITLE']
+        assert detector._get_suggested_prompt('abstr') == common['ABSTRACT']
+        assert detector._get_suggested_prompt('项目摘要') == common['摘要']
 
 
 if __name__ == '__main__':
@@ -0,0 +1,80 @@
+"""
+单元测试：SessionStore 会话存储
+
+测试会话的闲置过期与数量上限淘汰。
+"""
+
+import os
+import pytest
+
+from template_filler.session_store import SessionStore
+
+
+class TestSessionStore:
+    """SessionStore 单元测试"""
+    
+    @pytest.fixture
+    def temp_dir(self, tmp_path):
+        """临时目录（每个测试及 xdist 进程独立）"""
+        return str(tmp_path)
+    
+    def test_dict_interface(self):
+        """测试与 dict 一致的读写接口"""
+        sessions = SessionStore()
+        
+        sessions['a'] = {'context': '内容'}
+        sessions['a']['schema'] = {}
+        
+        assert 'a' in sessions
+        assert sessions['a'] == {'context': '内容', 'schema': {}}
+        assert sessions.get('missing') is None
+        
+        del sessions['a']
+        assert 'a' not in sessions
+    
+    def test_expired_session_removes_files(self, temp_dir):
+        """测试过期会话被淘汰并删除其文件"""
+        sessions = SessionStore(ttl_hours=0)
+        template_path = os.path.join(temp_dir, 'template.docx')
+        with open(template_path, 'wb') as f:
+            f.write(b'docx')
+        
+        sessions['a'] = {'template_path': template_path}
+        
+        assert 'a' not in sessions
+        assert not os.path.exists(template_path)
+    
+    def test_max_sessions_evicts_least_recent(self):
+        """测试超过数量上限时淘汰最久未访问的会话"""
+        sessions = SessionStore(max_sessions=2)
+        
+        sessions['a'] = {}
+        sessions['b'] = {}
+        sessions['a']  # 访问后 b 成为最久未访问的会话
+        sessions['c'] = {}
+        
+        assert list(sessions) == ['a', 'c']
+    
+    def test_pinned_session_not_evicted(self, temp_dir):
+        """测试处理中的会话不会被淘汰，释放后才淘汰"""
+        sessions = SessionStore(ttl_hours=0)
+        template_path = os.path.join(temp_dir, 'template.docx')
+        with open(template_path, 'wb') as f:
+            f.write(b'docx')
+        
+        with sessions.pin('a'):
+            sessions['a'] = {'template_path': template_path}
+            sessions['b'] = {}
+            assert 'a' in sessions
+            assert os.path.exists(template_path)
+        
+        assert 'a' not in sessions
+        assert not os.path.exists(template_path)
+    
+    def test_evict_missing_file(self, temp_dir):
+        """测试会话文件已被删除时淘汰不报错"""
+        sessions = SessionStore(ttl_hours=0)
+        
+        sessions['a'] = {'template_path': os.path.join(temp_dir, 'missing.docx')}
+        
+        assert 'a' not in sessions
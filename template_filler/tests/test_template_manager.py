@@ -0,0 +1,94 @@
+"""
+单元测试：TemplateManager 模板库
+
+测试模板文件入库与 Schema 的 JSON 存储及旧版 YAML 迁移。
+"""
+
+import os
+import pytest
+import yaml
+
+from template_filler.template_manager import TemplateManager
+
+
+class TestTemplateManager:
+    """TemplateManager 单元测试"""
+    
+    SCHEMA = {
+        'system_prompt': '系统提示',
+        'placeholders': {'TITLE': {'prompt': '生成标题', 'mode': 'llm', 'options_count': 3}}
+    }
+    
+    @pytest.fixture
+    def manager(self, tmp_path):
+        """临时模板库（每个测试及 xdist 进程独立）"""
+        return TemplateManager(str(tmp_path / 'library'))
+    
+    @pytest.fixture
+    def source(self, tmp_path):
+        """用户的模板文件"""
+        path = tmp_path / 'user.docx'
+        path.write_bytes(b'original')
+        return path
+    
+    def _make_legacy(self, manager, template_id):
+        """把已入库模板的 Schema 改写为旧版的 schema.yaml"""
+        info = manager.index['templates'][template_id]
+        json_path = manager.storage_dir / info['schema']
+        yaml_path = json_path.with_name('schema.yaml')
+        yaml_path.write_text(yaml.safe_dump(self.SCHEMA, allow_unicode=True), encoding='utf-8')
+        json_path.unlink()
+        info['schema'] = str(yaml_path.relative_to(manager.storage_dir))
+        manager._save_index()
+        return yaml_path
+    
+    def test_add_template_copies_source(self, manager, source, tmp_path):
+        """测试入库时复制源文件，之后修改或替换源文件不影响库内模板"""
+        manager.add_template(str(source), 'Demo', {'placeholders': {}})
+        stored = manager.get_template('demo')['template_path']
+        assert not os.path.samefile(source, stored)
+        
+        # 原处编辑
+        with open(source, 'r+b') as f:
+            f.write(b'EDITED!!')
+        # 替换为新文件
+        replacement = tmp_path / 'new.docx'
+        replacement.write_bytes(b'replaced')
+        os.replace(replacement, source)
+        
+        with open(stored, 'rb') as f:
+            assert f.read() == b'original'
+    
+    def test_schema_json_round_trip(self, manager, source):
+        """测试 Schema 以 JSON 保存并原样读回"""
+        manager.add_template(str(source), 'Demo', self.SCHEMA)
+        
+        info = manager.index['templates']['demo']
+        assert info['schema'].endswith('schema.json')
+        
+        reloaded = TemplateManager(str(manager.storage_dir))
+        assert reloaded.get_template('demo')['schema'] == self.SCHEMA
+    
+    def test_read_legacy_yaml_schema(self, manager, source):
+        """测试读取旧版 schema.yaml"""
+        manager.add_template(str(source), 'Demo', {'placeholders': {}})
+        self._make_legacy(manager, 'demo')
+        
+        reloaded = TemplateManager(str(manager.storage_dir))
+        assert reloaded.get_template('demo')['schema'] == self.SCHEMA
+    
+    def test_update_schema_migrates_yaml(self, manager, source):
+        """测试 update_schema 写入 JSON 并删除旧版 YAML 文件"""
+        manager.add_template(str(source), 'Demo', {'placeholders': {}})
+        yaml_path = self._make_legacy(manager, 'demo')
+        
+        manager = TemplateManager(str(manager.storage_dir))
+        updated = {'placeholders': {'SUMMARY': {'prompt': '生成摘要', 'mode': 'llm'}}}
+        assert manager.update_schema('demo', updated)
+        
+        assert not yaml_path.exists()
+        json_path = yaml_path.with_name('schema.json')
+        assert json_path.read_bytes().lstrip().startswith(b'{')
+        reloaded = TemplateManager(str(manager.storage_dir))
+        assert reloaded.index['templates']['demo']['schema'].endswith('schema.json')
+        assert reloaded.get_template('demo')['schema'] == updated
@@ -0,0 +1,145 @@
+"""
+单元测试：TemplateParser 模板解析器
+
+测试 DOCX 模板的占位符查找、填充与解析缓存。
+"""
+
+import os
+import pytest
+import shutil
+
+from docx import Document
+from template_filler import template_parser
+from template_filler.template_parser import TemplateParser
+
+
+class TestTemplateParser:
+    """TemplateParser 单元测试"""
+    
+    @pytest.fixture
+    def temp_dir(self, tmp_path):
+        """临时目录（每个测试及 xdist 进程独立）"""
+        return str(tmp_path)
+    
+    @pytest.mark.requires_template
+    def test_find_placeholders(self, test_template_path):
+        """测试查找占位符"""
+        parser = TemplateParser(test_template_path)
+        
+        assert set(parser.find_placeholders()) == {'TITLE', 'SUMMARY', 'SIGNIFICANCE', 'KEYWORDS'}
+        # 只查找占位符时不加载 Document
+        assert 'document' not in parser.__dict__
+        
+        # 加载后的结果与直接扫描 XML 一致
+        parser.document
+        assert set(parser.find_placeholders()) == {'TITLE', 'SUMMARY', 'SIGNIFICANCE', 'KEYWORDS'}
+    
+    @pytest.mark.requires_template
+    def test_fill_and_save(self, test_template_path, temp_dir):
+        """测试填充并保存"""
+        output_path = os.path.join(temp_dir, 'output.docx')
+        parser = TemplateParser(test_template_path)
+        
+        parser.fill_placeholders({'TITLE': '测试标题'})
+        parser.save(output_path)
+        
+        text = '\n'.join(p.text for p in Document(output_path).paragraphs)
+        assert '测试标题' in text
+        assert '{{TITLE}}' not in text
+    
+    def test_fill_split_runs(self, temp_dir):
+        """测试跨 run 的占位符及同一段落中的多个占位符"""
+        template_path = os.path.join(temp_dir, 'template.docx')
+        document = Document()
+        paragraph = document.add_paragraph()
+        for text in ('标题：{{TI', '', 'TLE}}，', '{{NAME}}', ' 与 {{NAME}}', '{{KEEP}}', '尾部'):
+            paragraph.add_run(text)
+        paragraph.runs[2].bold = True
+        document.save(template_path)
+        
+        parser = TemplateParser(template_path)
+        parser.fill_placeholders({'TITLE': '很长的测试标题', 'NAME': '张三'})
+        
+        runs = parser.document.paragraphs[0].runs
+        assert [run.text for run in runs] == ['标题：很长的测试标题', '', '，', '张三', ' 与 张三', '{{KEEP}}', '尾部']
+        assert runs[2].bold
+    
+    def test_fill_nested_table(self, temp_dir):
+        """测试表格及嵌套表格中的占位符"""
+        template_path = os.path.join(temp_dir, 'template.docx')
+        document = Document()
+        cell = document.add_table(rows=1, cols=1).cell(0, 0)
+        cell.paragraphs[0].add_run('{{OUTER}}')
+        cell.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0].add_run('{{INNER}}')
+        document.save(template_path)
+        
+        parser = TemplateParser(template_path)
+        assert set(parser.find_placeholders()) == {'OUTER', 'INNER'}
+        
+        parser.fill_placeholders({'OUTER': '外层', 'INNER': '内层'})
+        outer = parser.document.tables[0].cell(0, 0)
+        assert outer.paragraphs[0].text == '外层'
+        assert outer.tables[0].cell(0, 0).paragraphs[0].text == '内层'
+    
+    def test_placeholder_order(self, temp_dir):
+        """测试占位符按首次出现顺序返回"""
+        template_path = os.path.join(temp_dir, 'template.docx')
+        document = Document()
+        document.add_paragraph('{{ZETA}} 与 {{ALPHA}}')
+        document.add_paragraph('{{MID}}{{ZETA}}')
+        document.save(template_path)
+        
+        parser = TemplateParser(template_path)
+        assert parser.find_placeholders() == ['ZETA', 'ALPHA', 'MID']
+        
+        # 加载 Document 后回退到逐段扫描，顺序保持一致
+        parser.document
+        assert parser.find_placeholders() == ['ZETA', 'ALPHA', 'MID']
+    
+    @pytest.mark.requires_template
+    def test_cached_document_not_shared(self, test_template_path):
+        """测试同一模板的多个解析器互不影响"""
+        first = TemplateParser(test_template_path)
+        first.fill_placeholders({'TITLE': '测试标题'})
+        
+        second = TemplateParser(test_template_path)
+        
+        assert first.document is not second.document
+        assert 'TITLE' in second.find_placeholders()
+    
+    @pytest.mark.requires_template
+    def test_modified_template_reparsed(self, test_template_path, temp_dir):
+        """测试模板文件变化后重新解析"""
+        template_path = os.path.join(temp_dir, 'template.docx')
+        shutil.copyfile(test_template_path, template_path)
+        assert 'TITLE' in TemplateParser(template_path).find_placeholders()
+        
+        document = Document()
+        document.add_paragraph('{{OTHER}}')
+        document.save(template_path)
+        
+        assert TemplateParser(template_path).find_placeholders() == ['OTHER']
+    
+    def test_document_cache_bounded_by_size(self, temp_dir, monkeypatch):
+        """测试解析缓存按模板文件总大小淘汰，超过上限的模板不缓存"""
+        monkeypatch.setattr(template_parser, '_DOCUMENT_CACHE', {})
+        paths = []
+        for name in ('a', 'b', 'c'):
+            path = os.path.join(temp_dir, f'{name}.docx')
+            document = Document()
+            document.add_paragraph(f'{{{{{name.upper()}}}}}')
+            document.save(path)
+            paths.append(path)
+        size = max(os.path.getsize(path) for path in paths)
+        # 只容得下两个模板
+        monkeypatch.setattr(template_parser, '_DOCUMENT_CACHE_BYTES', 2 * size + 1)
+        
+        for path in paths:
+            TemplateParser(path).document
+        cached = {key[0] for key in template_parser._DOCUMENT_CACHE}
+        assert cached == {os.stat(path).st_ino for path in paths[1:]}
+        
+        monkeypatch.setattr(template_parser, '_DOCUMENT_CACHE_BYTES', size - 1)
+        template_parser._DOCUMENT_CACHE.clear()
+        TemplateParser(paths[0]).document
+        assert not template_parser._DOCUMENT_CACHE